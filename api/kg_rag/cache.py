@@ -1,9 +1,76 @@
+import asyncio
+import contextlib
+import contextvars
+import functools
+import inspect
+import os
+import pickle
+import queue
 import sqlite3
+import threading
+import time
 from typing import Optional, Any, Dict
 import json
 from datetime import date
 from pathlib import Path
-import streamlit as st
+
+from api.kg_rag import codec
+from api.kg_rag.semantic_cache import KG_SEMANTIC_CACHE, SemanticIndex, tokenize
+
+KG_CACHE_DIR = os.getenv(
+    "KG_CACHE_DIR",
+    r"C:\\Users\\athar\\OneDrive\\Documents\\GitHub\\form-factory\\modules\\data\\kg_cache",
+)
+
+# Entries older than the TTL are never served (0 disables expiry). Beyond
+# MAX_ENTRIES rows or MAX_BYTES of responses (0 disables either bound) the
+# least recently ("lru") or least frequently ("lfu") used entries are evicted.
+KG_CACHE_TTL_SECONDS = float(os.getenv("KG_CACHE_TTL_SECONDS", "86400"))
+KG_CACHE_MAX_ENTRIES = int(os.getenv("KG_CACHE_MAX_ENTRIES", "10000"))
+KG_CACHE_MAX_BYTES = int(os.getenv("KG_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+KG_CACHE_EVICTION = os.getenv("KG_CACHE_EVICTION", "lru").lower()
+
+# Writes are queued and committed in batches of up to WRITE_BATCH_SIZE, at
+# most WRITE_FLUSH_INTERVAL seconds after they were queued.
+WRITE_BATCH_SIZE = 64
+WRITE_FLUSH_INTERVAL = 0.05
+
+# The writer thread records access stats and evicts every
+# MAINTENANCE_INTERVAL seconds, deleting at most EVICTION_BATCH rows per pass
+# so eviction never holds the write lock for long.
+MAINTENANCE_INTERVAL = 5.0
+EVICTION_BATCH = 256
+
+EVICTION_ORDER = {
+    "lru": "last_accessed",
+    "lfu": "hits, last_accessed",
+}
+
+COLUMNS = {
+    "created_at": "REAL NOT NULL DEFAULT 0",
+    "last_accessed": "REAL NOT NULL DEFAULT 0",
+    "hits": "INTEGER NOT NULL DEFAULT 0",
+    "size": "INTEGER NOT NULL DEFAULT 0",
+}
+
+PRAGMAS = [
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA cache_size = -8192",
+    "PRAGMA mmap_size = 67108864",
+    "PRAGMA busy_timeout = 5000",
+]
+
+SELECT_SQL = 'SELECT response, created_at FROM cache WHERE query = ?'
+DELETE_SQL = 'DELETE FROM cache WHERE query = ?'
+INSERT_SQL = '''
+    INSERT OR REPLACE INTO cache (query, response, created_at, last_accessed, hits, size)
+    VALUES (?, ?, ?, ?, 0, ?)
+'''
+TOUCH_SQL = 'UPDATE cache SET last_accessed = max(last_accessed, ?), hits = hits + ? WHERE query = ?'
+EXPIRE_SQL = '''
+    DELETE FROM cache WHERE rowid IN (SELECT rowid FROM cache WHERE created_at < ? LIMIT ?)
+'''
 
 class CustomJSONEncoder(json.JSONEncoder):
     def default(self, obj):
@@ -12,29 +79,180 @@ class CustomJSONEncoder(json.JSONEncoder):
         return super().default(obj)
 
 class Cache:
-    def __init__(self, db_path: Optional[str] = None):
-        """Initialize the cache with optional custom database path."""
-        try:
-            cache_dir = Path(r"C:\\Users\\athar\\OneDrive\\Documents\\GitHub\\form-factory\\modules\\data\\kg_cache")
-            cache_dir.mkdir(parents=True, exist_ok=True)
-            self.db_path = str(cache_dir / 'cache.db')
-            self._create_table()
-        except Exception:
-            # Fallback to in-memory cache if file-based cache fails
-            self.db_path = ":memory:"
-            self._create_table()
+    """SQLite-backed answer cache shared by every bot request.
+
+    Each thread keeps one long-lived connection (WAL mode, so readers never
+    wait for the writer), and sqlite3's statement cache keeps the SELECT and
+    INSERT prepared on it. Writes go through a queue drained by a single
+    writer thread that commits them in batches; until a write is committed
+    it is served from ``_pending``, so a get() right after a set() still hits.
+
+    Entries expire ``ttl`` seconds after they were written. Hits are counted
+    in memory and written back in batches by the writer thread, which also
+    evicts expired entries and, beyond ``max_entries``/``max_bytes``, the
+    least recently or least frequently used ones a batch at a time.
+
+    With ``semantic`` (KG_SEMANTIC_CACHE) enabled, cached questions are also
+    kept in a SemanticIndex so get_similar() can answer paraphrases.
+    """
+
+    def __init__(
+        self,
+        db_path: Optional[str] = None,
+        ttl: Optional[float] = None,
+        max_entries: Optional[int] = None,
+        max_bytes: Optional[int] = None,
+        eviction: Optional[str] = None,
+        semantic: Optional[bool] = None,
+        name: str = "cache",
+    ):
+        """Initialize the cache with optional custom database path and bounds."""
+        self.ttl = KG_CACHE_TTL_SECONDS if ttl is None else ttl
+        self.max_entries = KG_CACHE_MAX_ENTRIES if max_entries is None else max_entries
+        self.max_bytes = KG_CACHE_MAX_BYTES if max_bytes is None else max_bytes
+        self.eviction = KG_CACHE_EVICTION if eviction is None else eviction
+        if self.eviction not in EVICTION_ORDER:
+            raise ValueError(f"Unknown cache eviction policy {self.eviction!r}, expected one of {sorted(EVICTION_ORDER)}")
+        self._local = threading.local()
+        self._connections = []
+        self._connections_lock = threading.Lock()
+        self._pending: Dict[str, Any] = {}
+        self._pending_lock = threading.Lock()
+        # query -> (last access time, hits) not yet written back
+        self._touches: Dict[str, Any] = {}
+        self._writes = queue.Queue()
+        self._writer = None
+        self._keeper = None
+        self._closed = False
+        self._flights: Dict[str, Any] = {}
+        self._flights_lock = threading.Lock()
+        self._async_flights: Dict[str, Any] = {}
+        self._counters = {"hits": 0, "semantic_hits": 0, "misses": 0, "coalesced": 0}
+        self._counters_lock = threading.Lock()
+        if db_path == ":memory:":
+            self._use_memory()
+        else:
+            try:
+                if db_path is None:
+                    cache_dir = Path(KG_CACHE_DIR)
+                    cache_dir.mkdir(parents=True, exist_ok=True)
+                    db_path = str(cache_dir / f'{name}.db')
+                self.db_path = db_path
+                self._uri = False
+                self._create_table()
+            except Exception as e:
+                # Fallback to in-memory cache if file-based cache fails
+                print(f"Falling back to an in-memory KG cache: {e}")
+                self.close_connections()
+                self._local = threading.local()
+                self._use_memory()
+        self.semantic = SemanticIndex() if (KG_SEMANTIC_CACHE if semantic is None else semantic) else None
+        if self.semantic is not None:
+            self._index_stored_questions()
+        self._ensure_writer()
+
+    def _use_memory(self):
+        """Switch to an in-memory database shared by every thread's connection.
+
+        A plain ":memory:" would give each connection its own empty database,
+        so a named shared-cache one is used; the keeper connection keeps it
+        alive while the cache exists.
+        """
+        self.db_path = f"file:kg_cache_{id(self)}?mode=memory&cache=shared"
+        self._uri = True
+        self._keeper = self._open()
+        self._create_table()
+
+    def _open(self):
+        conn = sqlite3.connect(
+            self.db_path,
+            uri=self._uri,
+            isolation_level=None,
+            check_same_thread=False,
+            cached_statements=64,
+        )
+        if not self._uri:
+            conn.execute("PRAGMA journal_mode = WAL")
+        for pragma in PRAGMAS:
+            conn.execute(pragma)
+        with self._connections_lock:
+            self._connections.append(conn)
+        return conn
+
+    def _connection(self):
+        """This thread's connection, opened on first use"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = self._open()
+        return conn
 
     def _create_table(self):
-        """Create the cache table if it doesn't exist."""
-        with sqlite3.connect(self.db_path) as conn:
-            conn.execute('''
-                CREATE TABLE IF NOT EXISTS cache (
-                    query TEXT PRIMARY KEY,
-                    response TEXT
-                )
-            ''')
+        """Create the cache table if it doesn't exist, adding columns missing from older files."""
+        conn = self._connection()
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS cache (
+                query TEXT PRIMARY KEY,
+                response TEXT
+            )
+        ''')
+        existing = {row[1] for row in conn.execute("PRAGMA table_info(cache)")}
+        missing = [name for name in COLUMNS if name not in existing]
+        for name in missing:
+            conn.execute(f"ALTER TABLE cache ADD COLUMN {name} {COLUMNS[name]}")
+        if missing:
+            # Entries from before the migration count as written and used now
+            now = time.time()
+            conn.execute(
+                '''
+                UPDATE cache SET
+                    created_at = CASE WHEN created_at = 0 THEN ? ELSE created_at END,
+                    last_accessed = CASE WHEN last_accessed = 0 THEN ? ELSE last_accessed END,
+                    size = length(response)
+                ''',
+                (now, now),
+            )
+        conn.execute("CREATE INDEX IF NOT EXISTS cache_created_at ON cache (created_at)")
+        conn.execute("CREATE INDEX IF NOT EXISTS cache_last_accessed ON cache (last_accessed)")
+        conn.execute("CREATE INDEX IF NOT EXISTS cache_hits ON cache (hits, last_accessed)")
+        conn.execute("CREATE TABLE IF NOT EXISTS cache_meta (name TEXT PRIMARY KEY, value TEXT)")
+
+    def get_meta(self, name: str, default: Optional[str] = None) -> Optional[str]:
+        """A small named value stored next to the entries and never evicted"""
+        row = self._connection().execute("SELECT value FROM cache_meta WHERE name = ?", (name,)).fetchone()
+        return row[0] if row else default
+
+    def set_meta(self, name: str, value: str):
+        self._connection().execute("INSERT OR REPLACE INTO cache_meta (name, value) VALUES (?, ?)", (name, value))
+
+    def _index_stored_questions(self):
+        """Seed the semantic index with the questions already in the cache"""
+        try:
+            rows = self._connection().execute(
+                "SELECT query FROM cache ORDER BY last_accessed DESC LIMIT ?", (self.semantic.max_entries,)
+            ).fetchall()
+        except sqlite3.Error as e:
+            print(f"Error reading cached questions: {e}")
+            return
+        for (query,) in reversed(rows):
+            self.semantic.add(query)
 
     def _serialize_value(self, value):
+        """Serialize value with the binary codec, or the JSON envelope if it cannot be pickled."""
+        try:
+            return codec.encode(value)
+        except (pickle.PicklingError, TypeError, AttributeError) as e:
+            print(f"Storing cache value as JSON, it cannot be pickled: {e}")
+            return self._serialize_legacy(value)
+
+    def _deserialize_value(self, value):
+        """Deserialize a value written by either codec."""
+        if codec.is_encoded(value):
+            return codec.decode(value)
+        if isinstance(value, bytes):
+            value = value.decode("utf-8")
+        return self._deserialize_legacy(value)
+
+    def _serialize_legacy(self, value):
         """Serialize value with type preservation."""
         if isinstance(value, str):
             # Store plain text as-is
@@ -54,7 +272,7 @@ class Cache:
             # Fallback for other types
             return json.dumps({'type': 'other', 'value': str(value)})
 
-    def _deserialize_value(self, value_str):
+    def _deserialize_legacy(self, value_str):
         """Deserialize value with type handling."""
         try:
             data = json.loads(value_str)
@@ -89,71 +307,441 @@ class Cache:
 
     def get(self, query: str) -> Optional[Any]:
         """Retrieve a cached response for the given query."""
+        with self._pending_lock:
+            if query in self._pending:
+                self._touch(query)
+                return self._pending[query]
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-                cursor.execute('SELECT response FROM cache WHERE query = ?', (query,))
-                if result := cursor.fetchone():
-                    return self._deserialize_value(result[0])
-        except (sqlite3.Error, json.JSONDecodeError):
-            pass
+            result = self._connection().execute(SELECT_SQL, (query,)).fetchone()
+            if result and not self._expired(result[1]):
+                with self._pending_lock:
+                    self._touch(query)
+                return self._deserialize_value(result[0])
+        except sqlite3.Error as e:
+            print(f"Error reading cache entry for query: {query}: {e}")
+        except ValueError as e:
+            # A corrupt or unreadable row is a miss; drop it so it is recomputed
+            print(f"Dropping unreadable cache entry for query: {query}: {e}")
+            try:
+                self._connection().execute(DELETE_SQL, (query,))
+            except sqlite3.Error as e:
+                print(f"Error deleting cache entry for query: {query}: {e}")
         return None
 
+    def get_similar(self, query: str) -> Optional[Any]:
+        """Cached response of a paraphrase of ``query``, if the semantic tier finds one."""
+        if self.semantic is None:
+            return None
+        match = self.semantic.lookup(query)
+        if match is None or match == query:
+            return None
+        result = self.get(match)
+        if result is None:
+            # Expired or evicted from the exact-match cache
+            self.semantic.remove(match)
+            return None
+        print(f"Semantic cache match for query: {query} -> {match}")
+        return result
+
+    def begin_flight(self, key: str):
+        """(flight, True) for the first caller of ``key``, (its flight, False) for the rest"""
+        with self._flights_lock:
+            flight = self._flights.get(key)
+            if flight is not None:
+                return flight, False
+            flight = self._flights[key] = _Flight()
+            return flight, True
+
+    def end_flight(self, key: str, flight):
+        with self._flights_lock:
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+        flight.done.set()
+
+    def count(self, counter: str):
+        with self._counters_lock:
+            self._counters[counter] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """Lookup counters since start-up, plus current queue and flight sizes"""
+        with self._counters_lock:
+            counters = dict(self._counters)
+        lookups = counters["hits"] + counters["semantic_hits"] + counters["misses"] + counters["coalesced"]
+        served = counters["hits"] + counters["semantic_hits"] + counters["coalesced"]
+        return {
+            **counters,
+            "hit_rate": served / lookups if lookups else 0.0,
+            "in_flight": len(self._flights) + len(self._async_flights),
+            "pending_writes": len(self._pending),
+            "semantic_entries": len(self.semantic) if self.semantic is not None else 0,
+        }
+
+    def _expired(self, created_at):
+        return self.ttl > 0 and created_at < time.time() - self.ttl
+
+    def _touch(self, query):
+        """Record a hit; called with _pending_lock held"""
+        _, hits = self._touches.get(query, (0.0, 0))
+        self._touches[query] = (time.time(), hits + 1)
+
     def set(self, query: str, response: Any):
         """Store a response in the cache for the given query."""
+        if self._closed:
+            return
+        with self._pending_lock:
+            self._pending[query] = response
+        self._writes.put((query, response))
+        if self.semantic is not None:
+            self.semantic.add(query)
+        self._ensure_writer()
+
+    def _ensure_writer(self):
+        if self._writer is None:
+            with self._connections_lock:
+                if self._writer is None:
+                    self._writer = threading.Thread(target=self._write_loop, name="kg-cache-writer", daemon=True)
+                    self._writer.start()
+
+    def _write_loop(self):
+        next_maintenance = time.monotonic() + MAINTENANCE_INTERVAL
+        while True:
+            try:
+                item = self._writes.get(timeout=max(0.0, next_maintenance - time.monotonic()))
+            except queue.Empty:
+                next_maintenance = time.monotonic() + self._maintain()
+                continue
+            if item is None:
+                self._write_touches()
+                self._writes.task_done()
+                return
+            batch = [item]
+            deadline = time.monotonic() + WRITE_FLUSH_INTERVAL
+            while len(batch) < WRITE_BATCH_SIZE:
+                try:
+                    item = self._writes.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if item is None:
+                    # Let the loop see the stop marker after this batch
+                    self._writes.put(None)
+                    self._writes.task_done()
+                    break
+                batch.append(item)
+            self._write_batch(batch)
+            for _ in batch:
+                self._writes.task_done()
+
+    def _write_batch(self, batch):
+        """Commit a batch of queued writes in one transaction"""
+        rows = {}
+        for query, response in batch:
+            rows[query] = response
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                conn.execute('''
-                    INSERT OR REPLACE INTO cache (query, response)
-                    VALUES (?, ?)
-                ''', (query, self._serialize_value(response)))
-        except sqlite3.Error:
-            pass
+            now = time.time()
+            encoded = []
+            for query, response in rows.items():
+                value = self._serialize_value(response)
+                encoded.append((query, value, now, now, len(value)))
+            conn = self._connection()
+            conn.execute("BEGIN")
+            try:
+                conn.executemany(INSERT_SQL, encoded)
+                conn.execute("COMMIT")
+            except sqlite3.Error:
+                conn.execute("ROLLBACK")
+                raise
+        except Exception as e:
+            print(f"Error writing {len(rows)} cache entries: {e}")
+        finally:
+            with self._pending_lock:
+                for query, response in rows.items():
+                    # A newer set() for the same query is still queued
+                    if self._pending.get(query) is response:
+                        del self._pending[query]
+
+    def _write_touches(self):
+        """Write the access times and hit counts recorded since the last call"""
+        with self._pending_lock:
+            touches, self._touches = self._touches, {}
+        if not touches:
+            return
+        try:
+            conn = self._connection()
+            conn.execute("BEGIN")
+            try:
+                conn.executemany(TOUCH_SQL, [(accessed, hits, query) for query, (accessed, hits) in touches.items()])
+                conn.execute("COMMIT")
+            except sqlite3.Error:
+                conn.execute("ROLLBACK")
+                raise
+        except Exception as e:
+            print(f"Error recording cache accesses: {e}")
+
+    def _maintain(self):
+        """One incremental maintenance pass; returns the seconds until the next one"""
+        self._write_touches()
+        try:
+            deleted = self.evict(EVICTION_BATCH)
+        except sqlite3.Error as e:
+            print(f"Error evicting cache entries: {e}")
+            return MAINTENANCE_INTERVAL
+        # Keep going soon while a backlog is being worked off
+        return WRITE_FLUSH_INTERVAL if deleted >= EVICTION_BATCH else MAINTENANCE_INTERVAL
+
+    def evict(self, limit=EVICTION_BATCH):
+        """Delete up to ``limit`` expired or over-bound entries; returns how many went"""
+        conn = self._connection()
+        deleted = 0
+        if self.ttl > 0:
+            deleted += conn.execute(EXPIRE_SQL, (time.time() - self.ttl, limit)).rowcount
+        if deleted >= limit or (self.max_entries <= 0 and self.max_bytes <= 0):
+            return deleted
+        entries, total_bytes = conn.execute("SELECT count(*), coalesce(sum(size), 0) FROM cache").fetchone()
+        excess = max(0, entries - self.max_entries) if self.max_entries > 0 else 0
+        if self.max_bytes > 0 and total_bytes > self.max_bytes:
+            # Enough rows to cover the excess bytes at the average entry size
+            average = max(1, total_bytes // max(entries, 1))
+            excess = max(excess, -(-(total_bytes - self.max_bytes) // average))
+        excess = min(excess, limit - deleted)
+        if excess:
+            deleted += conn.execute(
+                f"DELETE FROM cache WHERE rowid IN (SELECT rowid FROM cache ORDER BY {EVICTION_ORDER[self.eviction]} LIMIT ?)",
+                (excess,),
+            ).rowcount
+        return deleted
+
+    def clear(self):
+        """Drop every entry, including queued writes and the semantic index."""
+        self.flush()
+        with self._pending_lock:
+            self._pending.clear()
+            self._touches.clear()
+        self._connection().execute("DELETE FROM cache")
+        if self.semantic is not None:
+            self.semantic = SemanticIndex(self.semantic.threshold, self.semantic.max_entries)
+
+    def flush(self):
+        """Block until every queued write is committed."""
+        if self._writer is not None:
+            self._writes.join()
 
     def close(self):
-        """Close any open database connections."""
-        pass
+        """Commit queued writes and close every open database connection."""
+        if self._closed:
+            return
+        self._closed = True
+        if self._writer is not None and self._writer.is_alive():
+            self._writes.put(None)
+            self._writer.join()
+        self.close_connections()
+
+    def close_connections(self):
+        with self._connections_lock:
+            connections, self._connections = self._connections, []
+        for conn in connections:
+            try:
+                conn.close()
+            except sqlite3.Error:
+                pass
 
     def __del__(self):
-        self.close()
+        try:
+            self.close()
+        except Exception:
+            pass
+
+
+class _Flight:
+    """One in-progress computation that identical concurrent questions wait for"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+def flight_key(question: str) -> str:
+    """Questions that differ only in case, punctuation or spacing share a flight"""
+    return " ".join(tokenize(question)) or question
+
+
+# Request-scoped: set by the bot routes from the X-Bypass-Cache header, and
+# inherited by anything the request runs (threads started via copy_context).
+bypass_cache_var = contextvars.ContextVar("bypass_cache", default=False)
 
 
-def cacheable(cache_attr='cache'):
+@contextlib.contextmanager
+def bypass_cache(bypass: bool = True):
+    """Skip cache reads and writes for cacheable calls made inside the block"""
+    token = bypass_cache_var.set(bypass)
+    try:
+        yield
+    finally:
+        bypass_cache_var.reset(token)
+
+
+def cache_bypassed() -> bool:
+    return bypass_cache_var.get()
+
+
+def lookup_cached(cache, question):
+    """Exact or semantic cache hit for ``question``, counted"""
+    result = cache.get(question)
+    if result:
+        cache.count("hits")
+        print(f"Using cached result for query: {question}")
+        return result
+    result = cache.get_similar(question)
+    if result:
+        cache.count("semantic_hits")
+        return result
+    return None
+
+
+def store_result(cache, question, result):
+    try:
+        cache.set(question, result)
+        print(f"Successfully cached result for query: {question}")
+    except Exception as cache_error:
+        print(f"Error caching result: {str(cache_error)}")
+
+
+def cacheable(cache_attr='cache', key=None, flight_by=flight_key):
     """
-    Decorator to handle caching logic for methods.
+    Decorator to handle caching logic for methods, sync or async.
+
+    Concurrent calls with the same (normalized) question are single-flighted:
+    the first caller computes the answer and the others wait for it, sharing
+    its result or its exception. Async calls compute in a separate task, so
+    cancelling any caller, the first one included, leaves the rest waiting.
+    Hits, misses and coalesced calls are counted on the cache (see
+    Cache.stats()).
     
     Args:
         cache_attr (str): Name of the cache attribute in the instance
+        key (callable): Builds the cache key from the method's arguments;
+            defaults to the first argument (the question)
+        flight_by (callable): Maps the cache key to the single-flight key;
+            defaults to flight_key(), which ignores case and punctuation.
+            None uses the cache key itself, for keys such as Cypher where
+            punctuation matters
     """
+    def cache_key(args, kwargs):
+        if key is not None:
+            return key(*args, **kwargs)
+        return args[0] if args else kwargs.get('question', '')
+
     def decorator(func):
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(instance, *args, **kwargs):
+                question = cache_key(args, kwargs)
+                cache = getattr(instance, cache_attr)
+                if cache_bypassed():
+                    return await func(instance, *args, **kwargs)
+
+                cached_result = lookup_cached(cache, question)
+                if cached_result:
+                    return cached_result
+
+                key = flight_by(question) if flight_by else question
+                task = cache._async_flights.get(key)
+                if task is not None:
+                    cache.count("coalesced")
+                else:
+                    cache.count("misses")
+
+                    async def compute():
+                        result = await func(instance, *args, **kwargs)
+                        store_result(cache, question, result)
+                        return result
+
+                    def finished(done):
+                        if cache._async_flights.get(key) is done:
+                            del cache._async_flights[key]
+                        # Retrieved here so an unawaited failure is not logged as lost
+                        if not done.cancelled():
+                            done.exception()
+
+                    # The work runs in its own task, so the caller that started
+                    # it can disconnect without cancelling the others
+                    task = asyncio.ensure_future(compute())
+                    cache._async_flights[key] = task
+                    task.add_done_callback(finished)
+                # shield: a cancelled caller must not cancel the shared call
+                return await asyncio.shield(task)
+            return async_wrapper
+
+        @functools.wraps(func)
         def wrapper(instance, *args, **kwargs):
             # First argument is the instance
-            question = args[0] if args else kwargs.get('question', '')
+            question = cache_key(args, kwargs)
             
             # Get cache instance and bypass flag
             cache = getattr(instance, cache_attr)
-            bypass_cache = False
-            if hasattr(st, 'session_state') and 'bypass_cache' in st.session_state:
-                bypass_cache = st.session_state.bypass_cache
+            if cache_bypassed():
+                return func(instance, *args, **kwargs)
             
             # Try cache if not bypassing
-            if not bypass_cache:
-                cached_result = cache.get(question)
-                if cached_result:
-                    print(f"Using cached result for query: {question}")
-                    return cached_result
-            
-            # Execute original function
-            result = func(instance, *args, **kwargs)
-            
-            # Store in cache if not bypassing
-            if not bypass_cache:
-                try:
-                    cache.set(question, result)
-                    print(f"Successfully cached result for query: {question}")
-                except Exception as cache_error:
-                    print(f"Error caching result: {str(cache_error)}")
-            
-            return result
+            cached_result = lookup_cached(cache, question)
+            if cached_result:
+                return cached_result
+
+            key = flight_by(question) if flight_by else question
+            flight, leader = cache.begin_flight(key)
+            if not leader:
+                cache.count("coalesced")
+                flight.done.wait()
+                if flight.error is not None:
+                    raise flight.error
+                return flight.result
+
+            cache.count("misses")
+            try:
+                # Execute original function
+                flight.result = func(instance, *args, **kwargs)
+            except BaseException as e:
+                flight.error = e
+                raise
+            else:
+                store_result(cache, question, flight.result)
+                return flight.result
+            finally:
+                cache.end_flight(key, flight)
         return wrapper
     return decorator
+
+
+def _benchmark(lookups=2000):
+    """Hit latency of a connection per lookup against the persistent connection"""
+    import tempfile
+
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = Cache(str(Path(tmp) / 'cache.db'))
+        for i in range(200):
+            cache.set(f"question {i}", {"result": f"answer {i}", "intermediate_steps": [{"query": "MATCH (n) RETURN n"}]})
+        cache.flush()
+
+        def connect_per_lookup(query):
+            # What get() used to do
+            with sqlite3.connect(cache.db_path) as conn:
+                result = conn.execute(SELECT_SQL, (query,)).fetchone()
+                return cache._deserialize_value(result[0])
+
+        for label, lookup in (("connection per lookup", connect_per_lookup), ("persistent connection", cache.get)):
+            started = time.perf_counter()
+            for i in range(lookups):
+                lookup(f"question {i % 200}")
+            print(f"{label:>24}: {(time.perf_counter() - started) / lookups * 1e6:8.1f} us/hit")
+
+        started = time.perf_counter()
+        for i in range(lookups):
+            cache.set(f"new question {i}", {"result": f"answer {i}"})
+        cache.flush()
+        print(f"{'queued writes':>24}: {(time.perf_counter() - started) / lookups * 1e6:8.1f} us/write")
+        cache.close()
+
+
+if __name__ == "__main__":
+    #   python -m api.kg_rag.cache
+    _benchmark()
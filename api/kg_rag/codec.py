@@ -0,0 +1,126 @@
+import os
+import pickle
+import struct
+import threading
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - zstandard is optional
+    zstandard = None
+
+# Every encoded value starts with MAGIC, a format version byte and a flags
+# byte; anything else in the cache is a row written by the old JSON codec.
+MAGIC = b"KGC"
+VERSION = 1
+HEADER = struct.Struct("3sBB")
+
+FLAG_ZSTD = 0x01
+
+# zstd level for payloads of at least COMPRESS_MIN_BYTES (0 disables)
+KG_CACHE_ZSTD_LEVEL = int(os.getenv("KG_CACHE_ZSTD_LEVEL", "3"))
+COMPRESS_MIN_BYTES = 512
+
+# zstd (de)compressor objects must not be shared between threads
+_local = threading.local()
+
+
+def _compressor():
+    compressor = getattr(_local, "compressor", None)
+    if compressor is None:
+        compressor = _local.compressor = zstandard.ZstdCompressor(level=KG_CACHE_ZSTD_LEVEL)
+    return compressor
+
+
+def _decompressor():
+    decompressor = getattr(_local, "decompressor", None)
+    if decompressor is None:
+        decompressor = _local.decompressor = zstandard.ZstdDecompressor()
+    return decompressor
+
+
+def is_encoded(value) -> bool:
+    """Whether a stored value was written by this codec"""
+    return isinstance(value, bytes) and value[:len(MAGIC)] == MAGIC
+
+
+def encode(value) -> bytes:
+    """Pickle (protocol 5) a cached value, zstd-compressing large payloads.
+
+    Dates, tuples and nested containers round-trip natively. Raises
+    pickle.PicklingError/TypeError for values that cannot be pickled.
+    """
+    payload = pickle.dumps(value, protocol=5)
+    flags = 0
+    if zstandard is not None and KG_CACHE_ZSTD_LEVEL > 0 and len(payload) >= COMPRESS_MIN_BYTES:
+        compressed = _compressor().compress(payload)
+        if len(compressed) < len(payload):
+            payload = compressed
+            flags |= FLAG_ZSTD
+    return HEADER.pack(MAGIC, VERSION, flags) + payload
+
+
+def decode(data: bytes):
+    """Inverse of encode(); raises ValueError for data it cannot read.
+
+    Cached values are only ever written by this process's Cache, never taken
+    from users, which is what makes unpickling them acceptable.
+    """
+    if len(data) < HEADER.size:
+        raise ValueError("Truncated cache value")
+    magic, version, flags = HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise ValueError("Not a binary cache value")
+    if version != VERSION:
+        raise ValueError(f"Unsupported cache value version {version}")
+    payload = memoryview(data)[HEADER.size:]
+    if flags & FLAG_ZSTD and zstandard is None:
+        raise ValueError("Cache value is zstd-compressed but zstandard is not installed")
+    try:
+        if flags & FLAG_ZSTD:
+            payload = _decompressor().decompress(payload)
+        return pickle.loads(payload)
+    except Exception as e:
+        raise ValueError(f"Corrupt cache value: {e}")
+
+
+def _benchmark(rows=200, repeat=200):
+    """Encode/decode time and stored size of the JSON envelope against this codec"""
+    import time
+    from datetime import date, timedelta
+
+    from api.kg_rag.cache import Cache
+
+    value = {
+        "query": "What is the production volume for each factory by date?",
+        "result": "Factory 1 produced the most units over the period. " * 4,
+        "intermediate_steps": [
+            {"query": "MATCH (f:Factory)-[:PRODUCED]->(b:Batch) RETURN f.name, b.date, b.volume ORDER BY b.date"},
+            {"context": [
+                {"factory": f"Factory {i % 5}", "date": date(2024, 1, 1) + timedelta(days=i), "volume": 500 + i % 97}
+                for i in range(rows)
+            ]},
+        ],
+    }
+    cache = Cache.__new__(Cache)
+    cases = [
+        ("json envelope", cache._serialize_legacy, cache._deserialize_legacy),
+        ("pickle-5" + (" + zstd" if zstandard and KG_CACHE_ZSTD_LEVEL > 0 else ""), encode, decode),
+    ]
+    print(f"{rows} context rows, zstandard {'installed' if zstandard else 'not installed'}")
+    for label, dump, load in cases:
+        stored = dump(value)
+        started = time.perf_counter()
+        for _ in range(repeat):
+            dump(value)
+        encode_time = (time.perf_counter() - started) / repeat
+        started = time.perf_counter()
+        for _ in range(repeat):
+            load(stored)
+        decode_time = (time.perf_counter() - started) / repeat
+        print(f"{label:>16}: encode {encode_time * 1e6:8.1f} us, decode {decode_time * 1e6:8.1f} us, {len(stored):7d} bytes")
+
+
+if __name__ == "__main__":
+    #   python -m api.kg_rag.codec
+    for rows in (10, 200, 2000):
+        _benchmark(rows)
@@ -0,0 +1,214 @@
+import os
+import re
+
+# Seconds a graph query may run before Neo4j terminates its transaction
+KG_QUERY_TIMEOUT = float(os.getenv("KG_QUERY_TIMEOUT", "10"))
+# Rows a query may return; a missing or larger final LIMIT is rewritten
+KG_QUERY_ROW_LIMIT = int(os.getenv("KG_QUERY_ROW_LIMIT", "100"))
+# Largest row estimate of any operator in the EXPLAIN plan (0 disables)
+KG_MAX_ESTIMATED_ROWS = float(os.getenv("KG_MAX_ESTIMATED_ROWS", "1000000"))
+
+# Labels and relationship types of the factory graph (see the schema in
+# cypher_prompt_template.py). Chat history nodes are deliberately absent.
+SCHEMA = {
+    "labels": {"Team", "Member", "Date", "Factory", "Machine", "Product", "Supplier", "RawMaterial"},
+    "relationship_types": {
+        "HAS_MEMBER", "HAS_MACHINE", "OPERATED_ON", "USED_ON",
+        "USED_BY_TEAM", "PRODUCED_ON", "SUPPLIED_BY", "PRODUCED_USING",
+    },
+}
+
+# Clauses that write, run procedures or change the session; generated
+# queries are read-only. Only matched at clause position, see _is_clause().
+WRITE_CLAUSES = re.compile(
+    r"(?<![\w$.`])(CREATE|MERGE|DELETE|DETACH|SET|REMOVE|DROP|FOREACH|CALL|LOAD\s+CSV|"
+    r"USING\s+PERIODIC\s+COMMIT|GRANT|REVOKE|DENY|ALTER|RENAME|USE)\b(?!\s*\.)",
+    re.IGNORECASE,
+)
+# Tokens after which a keyword is a name in an expression ("RETURN x AS set")
+_EXPRESSION_BEFORE = re.compile(
+    r"(?:[,=<>+\-*/%^(\[]|\b(?:AS|RETURN|WITH|BY|DISTINCT|AND|OR|XOR|NOT|IN|IS|WHERE|WHEN|THEN|ELSE|"
+    r"UNWIND|STARTS|ENDS|CONTAINS))\s*$",
+    re.IGNORECASE,
+)
+_TOKENS = re.compile(r"'(?:[^'\\]|\\.)*'|\"(?:[^\"\\]|\\.)*\"|`[^`]*`|//[^\n]*|/\*.*?\*/", re.DOTALL)
+_NAME = r"(?:`[^`]+`|\w+)"
+_MAP_KEY = re.compile(r"([{,]\s*)(" + _NAME + r"\s*:)")
+_REL_TYPES = re.compile(r"\[\s*(?:[A-Za-z_]\w*)?\s*:\s*([^\]*{]*)")
+_LABELS = re.compile(r":\s*(" + _NAME + r"(?:\s*[|&:]\s*" + _NAME + r")*)")
+_LABEL_WILDCARD = re.compile(r"[:|&]\s*[!%]")
+_LABELED_VARIABLE = re.compile(r"\(\s*([A-Za-z_]\w*)\s*:")
+# A node pattern without a label: "(n)", "()" or "(n {...})"; "(" must not
+# follow a name, which would make it a function call such as count(n)
+_BARE_NODE = re.compile(r"(?<![\w`])\(\s*([A-Za-z_]\w*)?\s*(?:\{[^{}]*\}\s*)?\)")
+_TYPED_BEFORE = re.compile(r"\[[^\[\]]*:[^\[\]]*\]\s*-\s*>?\s*$")
+_TYPED_AFTER = re.compile(r"\s*<?\s*-\s*\[[^\[\]]*:[^\[\]]*\]")
+_UNION = re.compile(r"\bUNION(?:\s+ALL)?\b", re.IGNORECASE)
+_FINAL_LIMIT = re.compile(r"\bLIMIT\s+(\S+)$", re.IGNORECASE)
+
+
+class CypherRejected(ValueError):
+    """Raised for a graph query that must not be sent to Neo4j"""
+
+
+def _without_comments(query: str) -> str:
+    return _TOKENS.sub(lambda m: " " if m.group(0).startswith("/") else m.group(0), query)
+
+
+def _blank(text: str, start: int, end: int) -> str:
+    return text[:start] + " " * (end - start) + text[end:]
+
+
+def _strip(query: str) -> str:
+    """The comment-free query with literals and map keys blanked, same length.
+
+    What remains is structure only: every ':' left precedes a label or a
+    relationship type, so positions still line up with ``query``.
+    """
+    for match in reversed(list(_TOKENS.finditer(query))):
+        token = match.group(0)
+        if token[0] in "'\"":
+            query = query[:match.start() + 1] + " " * (len(token) - 2) + query[match.end() - 1:]
+        elif token[0] == "`":
+            # A quoted name stays a name, but its ':' is not a label marker
+            query = query[:match.start()] + token.replace(":", "_") + query[match.end():]
+    depth, depths = 0, []
+    for char in query:
+        depth += (char == "{") - (char == "}")
+        depths.append(depth)
+    for match in reversed(list(_MAP_KEY.finditer(query))):
+        if depths[match.start()] > 0:
+            query = _blank(query, match.start(2), match.end(2))
+    return query
+
+
+def _names(chain: str):
+    return [name.strip("`") for name in re.findall(_NAME, chain)]
+
+
+def _is_clause(stripped: str, match) -> bool:
+    return not _EXPRESSION_BEFORE.search(stripped[:match.start()])
+
+
+def _schema_errors(stripped: str, schema: dict) -> list:
+    errors = []
+    if _LABEL_WILDCARD.search(stripped):
+        errors.append("Label expressions with ! or % are not allowed")
+
+    types = set()
+    for match in reversed(list(_REL_TYPES.finditer(stripped))):
+        types.update(_names(match.group(1).split("*")[0]))
+        stripped = _blank(stripped, match.start(), match.end())
+    # Every ':' left is a label, in a pattern or a predicate such as "n:Label"
+    labels = {name for chain in _LABELS.findall(stripped) for name in _names(chain)}
+
+    unknown = sorted(labels - set(schema["labels"]))
+    if unknown:
+        errors.append(f"Unknown node labels: {', '.join(unknown)}")
+    unknown = sorted(types - set(schema["relationship_types"]))
+    if unknown:
+        errors.append(f"Unknown relationship types: {', '.join(unknown)}")
+    return errors
+
+
+def _unbound_nodes(stripped: str) -> list:
+    """Nodes that could be any node in the database, e.g. the n of "MATCH (n)".
+
+    A node without a label is fine when its variable is labelled elsewhere
+    or a typed relationship leads to it.
+    """
+    labeled = set(_LABELED_VARIABLE.findall(stripped))
+    unbound = []
+    for match in _BARE_NODE.finditer(stripped):
+        variable = match.group(1)
+        if variable in labeled:
+            continue
+        if _TYPED_BEFORE.search(stripped[:match.start()]) or _TYPED_AFTER.match(stripped, match.end()):
+            continue
+        unbound.append(match.group(0).strip())
+    return unbound
+
+
+def _bound_rows(query: str, stripped: str) -> str:
+    """``query`` with a final LIMIT of at most KG_QUERY_ROW_LIMIT on every UNION branch"""
+    pieces, start = [], 0
+    separators = list(_UNION.finditer(stripped)) + [None]
+    for separator in separators:
+        end = separator.start() if separator else len(query)
+        branch, branch_stripped = query[start:end].strip(), stripped[start:end].strip()
+        match = _FINAL_LIMIT.search(branch_stripped)
+        if match is None:
+            branch = f"{branch}\nLIMIT {KG_QUERY_ROW_LIMIT}"
+        elif match.group(1).isdigit() and int(match.group(1)) > KG_QUERY_ROW_LIMIT:
+            branch = branch[:match.start(1)] + str(KG_QUERY_ROW_LIMIT) + branch[match.end(1):]
+        pieces.append(branch)
+        if separator:
+            pieces.append(f"\n{separator.group(0)}\n")
+            start = separator.end()
+    return "".join(pieces).strip()
+
+
+def validate_cypher(schema: dict, query: str) -> dict:
+    """Validate generated Cypher against schema rules.
+
+    Checks that the query is a single read-only statement whose labels and
+    relationship types, in patterns and predicates alike, exist in
+    ``schema`` ({"labels", "relationship_types"}; SCHEMA when None), and
+    that every node is tied to the schema by a label or a typed
+    relationship. Comments are removed and every UNION branch is bounded
+    with a final LIMIT of at most KG_QUERY_ROW_LIMIT. Returns {"valid",
+    "errors", "query"} where "query" is the rewritten statement.
+    """
+    schema = schema or SCHEMA
+    errors = []
+    query = _without_comments(query).strip().rstrip(";").strip()
+    stripped = _strip(query)
+
+    if not stripped.strip():
+        errors.append("Empty query")
+    if ";" in stripped:
+        errors.append("Only a single statement is allowed")
+    writes = sorted({
+        " ".join(match.group(1).upper().split())
+        for match in WRITE_CLAUSES.finditer(stripped) if _is_clause(stripped, match)
+    })
+    if writes:
+        errors.append(f"Write or procedure clauses are not allowed: {', '.join(writes)}")
+    errors += _schema_errors(stripped, schema)
+    unbound = _unbound_nodes(stripped)
+    if unbound:
+        errors.append(f"Nodes need a label or a typed relationship: {', '.join(unbound)}")
+
+    if not errors and KG_QUERY_ROW_LIMIT > 0:
+        query = _bound_rows(query, stripped)
+    return {"valid": not errors, "errors": errors, "query": query}
+
+
+def estimated_rows(plan) -> float:
+    """Largest EstimatedRows of any operator in an EXPLAIN plan"""
+    if not plan:
+        return 0.0
+    arguments = plan.get("args") or plan.get("arguments") or {}
+    rows = float(arguments.get("EstimatedRows", 0) or 0)
+    return max([rows] + [estimated_rows(child) for child in plan.get("children", [])])
+
+
+def guard(query: str, params=None, explain=None, schema=None) -> str:
+    """The query as it may be run, or CypherRejected.
+
+    ``explain(query, params)`` returns the EXPLAIN plan; when given, plans
+    estimated above KG_MAX_ESTIMATED_ROWS rows are rejected before the
+    query runs.
+    """
+    validation = validate_cypher(schema, query)
+    if not validation["valid"]:
+        raise CypherRejected("; ".join(validation["errors"]))
+    query = validation["query"]
+    if explain is not None and KG_MAX_ESTIMATED_ROWS > 0:
+        rows = estimated_rows(explain(query, params))
+        if rows > KG_MAX_ESTIMATED_ROWS:
+            raise CypherRejected(
+                f"The query would touch about {rows:,.0f} rows, more than the {KG_MAX_ESTIMATED_ROWS:,.0f} allowed; "
+                "ask about a narrower period, factory or machine"
+            )
+    return query
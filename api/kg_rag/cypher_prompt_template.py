@@ -1,4 +1,5 @@
 from langchain.prompts.prompt import PromptTemplate
+from api.kg_rag.cypher_guard import validate_cypher  # re-exported for callers of the prompt module
 
 CYPHER_GENERATION_TEMPLATE = '''\
 ### Task:
@@ -465,15 +466,6 @@ ORDER BY FactoryAverageProductionVolume DESC
 
 ### Response (Cypher only):'''
 
-def validate_cypher(schema: dict, query: str) -> dict:
-    """Validate generated Cypher against schema rules"""
-    # Implementation checks:
-    # 1. Node/relationship existence
-    # 2. Property type matching
-    # 3. Relationship direction validation
-    # 4. Constraint enforcement
-    return validation_result
-
 CYPHER_GENERATION_PROMPT = PromptTemplate(
     input_variables=['question'], template=CYPHER_GENERATION_TEMPLATE
 )
\ No newline at end of file
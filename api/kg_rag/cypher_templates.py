@@ -0,0 +1,441 @@
+import re
+from dataclasses import dataclass, field
+from typing import Any, Dict, Optional, Tuple
+
+# Question phrase -> USED_ON property. Only these properties can be bound to
+# $metric, which the templates read with dynamic property access (u[$metric]).
+METRICS = {
+    "profit margins": "profit_margin",
+    "profit margin": "profit_margin",
+    "profitable": "revenue",
+    "profit": "profit_margin",
+    "revenue": "revenue",
+    "production volume": "production_volume",
+    "production": "production_volume",
+    "co2 emissions": "co2_emissions",
+    "co2": "co2_emissions",
+    "emissions": "co2_emissions",
+    "energy consumption": "energy_consumption",
+    "energy efficiency": "energy_efficiency_rating",
+    "energy": "energy_consumption",
+    "defect rates": "defect_rate",
+    "defect rate": "defect_rate",
+    "defects": "defect_rate",
+    "machine utilization": "machine_utilization",
+    "utilization": "machine_utilization",
+    "breakdowns": "breakdowns",
+    "safety incidents": "safety_incidents",
+    # Downtime hours are not in the graph; plain "downtime" is left to the LLM
+    "cost of downtime": "cost_of_downtime",
+    "downtime cost": "cost_of_downtime",
+    "waste": "waste_generated",
+    "water usage": "water_usage",
+    "water": "water_usage",
+    "cycle time": "cycle_time",
+}
+
+# USED_ON properties stored as fractions (0.15 is a 15% profit margin)
+FRACTIONS = {"profit_margin", "defect_rate", "machine_utilization"}
+
+GRANULARITIES = {
+    "day": ("daily", "per day", "each day", "by day", "by date", "date wise", "day wise"),
+    "month": ("monthly", "per month", "each month", "by month", "month wise"),
+    "quarter": ("quarterly", "per quarter", "each quarter", "by quarter", "quarter wise"),
+    "year": ("yearly", "annual", "annually", "per year", "each year", "by year", "year wise"),
+}
+
+# Phrases asking for the bottom of a ranking rather than the top
+LOWEST = ("lowest", "least", "worst", "minimum", "fewest", "smallest", "poorest")
+
+# Slots naming what a question is about; a template that cannot filter by
+# one of them would silently answer for everything instead
+ENTITY_SLOTS = ("factory", "location", "machine_type", "machine_id", "team", "start", "end")
+
+# Questions that need reasoning across several measures go to the LLM
+OPEN_ENDED = re.compile(
+    r"\b(why|how come|explain|cause[sd]?|impact|affect|correlat\w*|relationship|compare|versus|vs|factors?)\b"
+)
+
+# Modifiers no template can apply: negation, relative periods, month names
+# and shifts. A template would silently answer for all time or all shifts,
+# so these questions go to the LLM as well.
+MONTH_NAMES = ("january", "february", "march", "april", "june", "july", "august",
+               "september", "october", "november", "december")
+UNHANDLED = re.compile(
+    r"\b(?:not|never|no|none|without|except|excluding)\b|n['\u2019]t\b"
+    r"|\b(?:last|past|previous|this|next|recent)\s+(?:\d+\s+)?(?:days?|weeks?|months?|quarters?|years?)\b"
+    r"|\b(?:today|yesterday|ago|since|before|after|between|recently|ytd)\b"
+    r"|\bshifts?\b|\b(?:" + "|".join(MONTH_NAMES) + r")\b|\b(?:in|during|for|of)\s+may\b|\bmay\s+\d{4}\b"
+)
+
+MACHINE_ID = re.compile(r"\blocation\s+([a-z])\s*-\s*factory\s+(\d+)\s*-\s*type\s+(\d+)\b")
+TEAM_ID = re.compile(r"\blocation\s+([a-z])_factory\s+(\d+)_member_(\d+)\b")
+FACTORY = re.compile(r"\bfactory\s+(\d+)\b")
+LOCATION = re.compile(r"\blocation\s+([a-z])\b")
+MACHINE_TYPE = re.compile(r"\btype\s+(\d+)\b")
+ISO_DATE = re.compile(r"\b(\d{4}-\d{2}-\d{2})\b")
+YEAR = re.compile(r"\b(?:in|during|for|of)\s+(\d{4})\b")
+THRESHOLD = re.compile(r"\b(below|under|less than|above|over|more than|greater than)\s+(\d+(?:\.\d+)?)\s*(%|percent)?")
+RELATIVE = re.compile(r"\b(above|below)\s+(?:the\s+)?(?:overall\s+)?(?:\w+\s+)?average\b")
+
+DATE_FILTER = (
+    "($start IS NULL OR d.date >= date($start)) AND ($end IS NULL OR d.date <= date($end))"
+)
+
+
+def _phrase_pattern(phrases):
+    words = sorted(phrases, key=len, reverse=True)
+    return re.compile(r"\b(?:" + "|".join(r"\s+".join(map(re.escape, p.split())) for p in words) + r")\b")
+
+
+@dataclass(frozen=True)
+class CypherTemplate:
+    """A hand-written Cypher query for one family of questions.
+
+    ``keywords`` are groups of alternative phrases, each of which must occur
+    in the question; ``slots`` must all be extracted from it. Every $name in
+    ``cypher`` is bound, unset optional slots as null.
+    """
+    name: str
+    example: str
+    cypher: str
+    keywords: Tuple[Tuple[str, ...], ...] = ()
+    slots: Tuple[str, ...] = ()
+    defaults: Dict[str, Any] = field(default_factory=dict)
+
+    @property
+    def parameters(self):
+        return tuple(dict.fromkeys(re.findall(r"\$(\w+)", self.cypher)))
+
+
+@dataclass(frozen=True)
+class TemplateMatch:
+    template: CypherTemplate
+    cypher: str
+    params: Dict[str, Any]
+    score: Tuple[int, int]
+
+
+TEMPLATES = [
+    CypherTemplate(
+        name="metric_by_factory",
+        example="What is the average profit margin for each factory?",
+        keywords=(("each factory", "every factory", "per factory", "by factory", "all factories", "factory wise", "factories"),),
+        slots=("metric",),
+        cypher="""\
+MATCH (f:Factory)-[:HAS_MACHINE]->(m:Machine)-[u:USED_ON]->(d:Date)
+WHERE ($location IS NULL OR f.location = $location) AND """ + DATE_FILTER + """
+RETURN f.factory_id AS Factory, avg(u[$metric]) AS Average, sum(u[$metric]) AS Total
+ORDER BY Factory""",
+    ),
+    CypherTemplate(
+        name="metric_by_machine_type",
+        example="What is the machine utilization by machine type in Factory 1?",
+        keywords=(("machine type", "machine types", "each type", "per type", "by type", "type of machine", "types of machine"),),
+        slots=("metric",),
+        cypher="""\
+MATCH (f:Factory)-[:HAS_MACHINE]->(m:Machine)-[u:USED_ON]->(d:Date)
+WHERE ($factory IS NULL OR f.factory_id = $factory) AND """ + DATE_FILTER + """
+RETURN m.machine_type AS MachineType, avg(u[$metric]) AS Average, sum(u[$metric]) AS Total
+ORDER BY MachineType""",
+    ),
+    CypherTemplate(
+        name="metric_by_location",
+        example="Total revenue per location in 2023",
+        keywords=(("each location", "every location", "per location", "by location", "all locations", "location wise", "locations"),),
+        slots=("metric",),
+        cypher="""\
+MATCH (f:Factory)-[:HAS_MACHINE]->(m:Machine)-[u:USED_ON]->(d:Date)
+WHERE """ + DATE_FILTER + """
+RETURN f.location AS Location, avg(u[$metric]) AS Average, sum(u[$metric]) AS Total
+ORDER BY Location""",
+    ),
+    CypherTemplate(
+        name="metric_over_time",
+        example="How does the profit margin change over time for Factory 1 (quarterly)?",
+        keywords=(("over time", "change", "changed", "time series", "history")
+                  + tuple(phrase for phrases in GRANULARITIES.values() for phrase in phrases),),
+        slots=("metric",),
+        defaults={"granularity": "month"},
+        cypher="""\
+MATCH (f:Factory)-[:HAS_MACHINE]->(m:Machine)-[u:USED_ON]->(d:Date)
+WHERE ($factory IS NULL OR f.factory_id = $factory)
+  AND ($machine_id IS NULL OR m.machine_id = $machine_id)
+  AND ($machine_type IS NULL OR m.machine_type = $machine_type)
+  AND """ + DATE_FILTER + """
+WITH CASE $granularity
+       WHEN 'day' THEN toString(d.date)
+       WHEN 'month' THEN substring(toString(d.date), 0, 7)
+       WHEN 'quarter' THEN toString(d.date.year) + '-Q' + toString((d.date.month - 1) / 3 + 1)
+       ELSE toString(d.date.year)
+     END AS Period, u
+RETURN Period, avg(u[$metric]) AS Average, sum(u[$metric]) AS Total
+ORDER BY Period""",
+    ),
+    CypherTemplate(
+        name="machine_metric_by_date",
+        example="Identify defect rates for machine Location A-Factory 1-Type 2",
+        slots=("machine_id", "metric"),
+        cypher="""\
+MATCH (m:Machine {machine_id: $machine_id})-[u:USED_ON]->(d:Date)
+WHERE """ + DATE_FILTER + """
+RETURN m.machine_id AS MachineID, d.date AS Date, u[$metric] AS Value
+ORDER BY Date""",
+    ),
+    CypherTemplate(
+        name="factories_metric_threshold",
+        example="Find factories with an average profit margin below 30",
+        keywords=(("factories", "factory"),),
+        slots=("metric", "threshold"),
+        cypher="""\
+MATCH (f:Factory)-[:HAS_MACHINE]->(m:Machine)-[u:USED_ON]->(d:Date)
+WHERE """ + DATE_FILTER + """
+WITH f, avg(u[$metric]) AS Average
+WHERE CASE $direction WHEN 'below' THEN Average < $threshold ELSE Average > $threshold END
+RETURN f.factory_id AS FactoryID, Average
+ORDER BY Average""",
+    ),
+    CypherTemplate(
+        name="factories_relative_to_average",
+        example="Which factories are above the production average?",
+        keywords=(("factories", "factory"),),
+        slots=("metric", "relative"),
+        cypher="""\
+MATCH (:Factory)-[:HAS_MACHINE]->(:Machine)-[r:USED_ON]->(d:Date)
+WHERE """ + DATE_FILTER + """
+WITH avg(r[$metric]) AS OverallAverage
+MATCH (f:Factory)-[:HAS_MACHINE]->(:Machine)-[r:USED_ON]->(d:Date)
+WHERE """ + DATE_FILTER + """
+WITH f, avg(r[$metric]) AS FactoryAverage, OverallAverage
+WHERE CASE $relative WHEN 'below' THEN FactoryAverage < OverallAverage ELSE FactoryAverage > OverallAverage END
+RETURN f.factory_id AS Factory, FactoryAverage, OverallAverage
+ORDER BY FactoryAverage DESC""",
+    ),
+    CypherTemplate(
+        name="best_day",
+        example="What day was the best for overall production?",
+        keywords=(("best day", "which day", "what day", "best date", "which date", "top day"),),
+        slots=("metric",),
+        cypher="""\
+MATCH (m:Machine)-[u:USED_ON]->(d:Date)
+WHERE """ + DATE_FILTER + """
+WITH d.date AS Date, sum(u[$metric]) AS Total
+RETURN Date, Total
+ORDER BY Total DESC
+LIMIT 1""",
+    ),
+    CypherTemplate(
+        name="worst_day",
+        example="Which day had the lowest production?",
+        keywords=(("worst day", "which day", "what day", "worst date", "which date"), LOWEST),
+        slots=("metric",),
+        cypher="""\
+MATCH (m:Machine)-[u:USED_ON]->(d:Date)
+WHERE """ + DATE_FILTER + """
+WITH d.date AS Date, sum(u[$metric]) AS Total
+RETURN Date, Total
+ORDER BY Total ASC
+LIMIT 1""",
+    ),
+    CypherTemplate(
+        name="best_year",
+        example="Which year was the most profitable?",
+        keywords=(("which year", "what year", "best year"),),
+        slots=("metric",),
+        cypher="""\
+MATCH (f:Factory)-[:HAS_MACHINE]->(m:Machine)-[u:USED_ON]->(d:Date)
+WITH substring(toString(d.date), 0, 4) AS Year, sum(u[$metric]) AS Total
+RETURN Year, Total
+ORDER BY Total DESC
+LIMIT 1""",
+    ),
+    CypherTemplate(
+        name="worst_year",
+        example="Which year was the least profitable?",
+        keywords=(("which year", "what year", "worst year"), LOWEST),
+        slots=("metric",),
+        cypher="""\
+MATCH (f:Factory)-[:HAS_MACHINE]->(m:Machine)-[u:USED_ON]->(d:Date)
+WITH substring(toString(d.date), 0, 4) AS Year, sum(u[$metric]) AS Total
+RETURN Year, Total
+ORDER BY Total ASC
+LIMIT 1""",
+    ),
+    CypherTemplate(
+        name="team_metric",
+        example="Total production volume of each team in Factory 1",
+        keywords=(("team", "teams"),),
+        slots=("metric",),
+        cypher="""\
+MATCH (t:Team)<-[:USED_BY_TEAM]-(m:Machine)-[u:USED_ON]->(d:Date)
+WHERE ($factory IS NULL OR t.factory = $factory) AND """ + DATE_FILTER + """
+RETURN t.id AS TeamID, sum(u[$metric]) AS Total, avg(u[$metric]) AS Average
+ORDER BY Total DESC""",
+    ),
+    CypherTemplate(
+        name="team_metric_lowest",
+        example="Which team has the lowest energy consumption?",
+        keywords=(("team", "teams"), LOWEST),
+        slots=("metric",),
+        cypher="""\
+MATCH (t:Team)<-[:USED_BY_TEAM]-(m:Machine)-[u:USED_ON]->(d:Date)
+WHERE ($factory IS NULL OR t.factory = $factory) AND """ + DATE_FILTER + """
+RETURN t.id AS TeamID, sum(u[$metric]) AS Total, avg(u[$metric]) AS Average
+ORDER BY Total ASC""",
+    ),
+    CypherTemplate(
+        name="team_members",
+        example="Get details about team Location A_Factory 1_Member_0 and its members",
+        keywords=(("team", "member", "members"),),
+        slots=("team",),
+        cypher="""\
+MATCH (t:Team {id: $team})-[:HAS_MEMBER]->(m)
+RETURN t, m""",
+    ),
+    CypherTemplate(
+        name="absenteeism",
+        example="What is the average absenteeism rate?",
+        keywords=(("absenteeism", "absentism", "absence"),),
+        cypher="""\
+MATCH (m:Machine)-[u:USED_BY_TEAM]->(t:Team)
+RETURN avg(coalesce(u.average_absentialism, u.average_absentism)) AS AverageAbsenteeism""",
+    ),
+    CypherTemplate(
+        name="absenteeism_by_team",
+        example="What is average absenteeism rate for each team?",
+        keywords=(("absenteeism", "absentism", "absence"), ("each team", "per team", "by team", "every team", "teams")),
+        cypher="""\
+MATCH (m:Machine)-[u:USED_BY_TEAM]->(t:Team)
+RETURN t.id AS Team, avg(coalesce(u.average_absentialism, u.average_absentism)) AS AverageAbsenteeism
+ORDER BY Team""",
+    ),
+    CypherTemplate(
+        name="absenteeism_by_location",
+        example="What is the average absenteeism rate for each location?",
+        keywords=(("absenteeism", "absentism", "absence"), ("location", "locations")),
+        cypher="""\
+MATCH (m:Machine)-[u:USED_BY_TEAM]->(t:Team)
+RETURN t.location AS Location, avg(coalesce(u.average_absentialism, u.average_absentism)) AS AverageAbsenteeism
+ORDER BY Location""",
+    ),
+    CypherTemplate(
+        name="locations",
+        example="How many locations are there?",
+        keywords=(("how many locations", "which locations", "what locations", "list locations", "list the locations", "list of locations"),),
+        cypher="""\
+MATCH (f:Factory)
+RETURN DISTINCT f.location AS Location
+ORDER BY Location""",
+    ),
+    CypherTemplate(
+        name="years_of_data",
+        example="How many years data is there?",
+        keywords=(("how many years", "which years", "what years"),),
+        cypher="""\
+MATCH (d:Date)
+RETURN DISTINCT substring(toString(d.date), 0, 4) AS Year
+ORDER BY Year""",
+    ),
+]
+
+# Precompiled once at import: keyword groups per template
+_COMPILED = [(template, [_phrase_pattern(group) for group in template.keywords]) for template in TEMPLATES]
+_METRIC = _phrase_pattern(METRICS)
+_GRANULARITY = [(name, _phrase_pattern(phrases)) for name, phrases in GRANULARITIES.items()]
+
+
+def extract_slots(question: str) -> Dict[str, Any]:
+    """Values the templates can bind, taken from a question"""
+    text = " ".join(question.lower().split())
+    slots = {}
+
+    # Composite ids first, so their parts are not read as a factory or type
+    match = TEAM_ID.search(text)
+    if match:
+        slots["team"] = f"Location {match.group(1).upper()}_Factory {match.group(2)}_Member_{match.group(3)}"
+        text = TEAM_ID.sub(" ", text)
+    match = MACHINE_ID.search(text)
+    if match:
+        slots["machine_id"] = f"Location {match.group(1).upper()}-Factory {match.group(2)}-Type {match.group(3)}"
+        text = MACHINE_ID.sub(" ", text)
+    for name, pattern, label in (("factory", FACTORY, "Factory {}"), ("location", LOCATION, "Location {}"), ("machine_type", MACHINE_TYPE, "Type {}")):
+        match = pattern.search(text)
+        if match:
+            slots[name] = label.format(match.group(1).upper())
+
+    dates = ISO_DATE.findall(text)
+    if dates:
+        dates = sorted(dates[:2])
+        slots["start"], slots["end"] = dates[0], dates[-1]
+    else:
+        match = YEAR.search(text)
+        if match:
+            slots["start"], slots["end"] = f"{match.group(1)}-01-01", f"{match.group(1)}-12-31"
+
+    match = _METRIC.search(text)
+    if match:
+        slots["metric"] = METRICS[" ".join(match.group(0).split())]
+    for name, pattern in _GRANULARITY:
+        if pattern.search(text):
+            slots["granularity"] = name
+            break
+    match = RELATIVE.search(text)
+    if match:
+        slots["relative"] = match.group(1)
+    else:
+        match = THRESHOLD.search(text)
+        if match:
+            slots["direction"] = "below" if match.group(1) in ("below", "under", "less than") else "above"
+            threshold = float(match.group(2))
+            # "profit margin over 20%" against a stored 0.15
+            if slots.get("metric") in FRACTIONS and (match.group(3) or threshold > 1):
+                threshold /= 100
+            slots["threshold"] = threshold
+    return slots
+
+
+def match(question: str) -> Optional[TemplateMatch]:
+    """The template that answers ``question`` with its parameters bound, or None.
+
+    A template is eligible when all its keyword groups and slots are found
+    and it has a parameter for every entity the question names. The one
+    matching the most intent (keyword groups and required slots) wins, then
+    the one binding the most optional parameters. Ties between templates,
+    open-ended questions and questions with a modifier no template applies
+    (UNHANDLED) return None so they go to Cypher generation instead.
+    """
+    text = " ".join(question.lower().split())
+    if OPEN_ENDED.search(text) or UNHANDLED.search(text):
+        return None
+    slots = extract_slots(question)
+    best = []
+    for template, groups in _COMPILED:
+        if any(not group.search(text) for group in groups):
+            continue
+        if any(slot not in slots for slot in template.slots):
+            continue
+        if any(name in slots and name not in template.parameters for name in ENTITY_SLOTS):
+            continue
+        optional = sum(1 for name in template.parameters if name in slots and name not in template.slots)
+        score = (len(groups) + len(template.slots), optional)
+        if best and score < best[0].score:
+            continue
+        params = {name: slots.get(name, template.defaults.get(name)) for name in template.parameters}
+        candidate = TemplateMatch(template, template.cypher, params, score)
+        best = [candidate] if not best or score > best[0].score else best + [candidate]
+    return best[0] if len(best) == 1 else None
+
+
+if __name__ == "__main__":
+    #   python -m api.kg_rag.cypher_templates
+    import time
+
+    for template in TEMPLATES:
+        matched = match(template.example)
+        started = time.perf_counter()
+        for _ in range(1000):
+            match(template.example)
+        elapsed = (time.perf_counter() - started) / 1000
+        outcome = matched.template.name if matched else "no match"
+        flag = "" if matched and matched.template is template else "  <-- expected " + template.name
+        print(f"{elapsed * 1e6:6.1f} us  {outcome:<30} {template.example}{flag}")
@@ -0,0 +1,264 @@
+import atexit
+import os
+import queue
+import threading
+import time
+from collections import OrderedDict, deque, namedtuple
+
+from api.kg_rag import q_engine
+
+# Messages of a session kept in memory (3 question/answer pairs)
+KG_HISTORY_WINDOW = int(os.getenv("KG_HISTORY_WINDOW", "6"))
+# Seconds the writer waits for more messages before committing a batch
+KG_HISTORY_FLUSH_INTERVAL = float(os.getenv("KG_HISTORY_FLUSH_INTERVAL", "0.5"))
+HISTORY_BATCH_SIZE = 256
+HISTORY_RETRIES = 3
+HISTORY_DATABASE = "neo4j"
+# Open sessions kept in memory, and seconds of inactivity before one is closed
+KG_MAX_SESSIONS = int(os.getenv("KG_MAX_SESSIONS", "1000"))
+KG_SESSION_IDLE_SECONDS = float(os.getenv("KG_SESSION_IDLE_SECONDS", "1800"))
+
+# Same graph layout and properties as langchain's Neo4jChatMessageHistory:
+# the session node points at its newest message, messages are chained
+# oldest -> newest and carry their role as ``type``.
+APPEND_MESSAGE_QUERY = (
+    "MERGE (s:Session {id: $session_id}) "
+    "ON CREATE SET s.createdAt = datetime() "
+    "WITH s OPTIONAL MATCH (s)-[lm:LAST_MESSAGE]->(last_message) "
+    "CREATE (s)-[:LAST_MESSAGE]->(new:Message {type: $type, content: $content, createdAt: datetime()}) "
+    "WITH new, lm, last_message WHERE last_message IS NOT NULL "
+    "CREATE (last_message)-[:NEXT]->(new) "
+    "DELETE lm"
+)
+
+RECENT_MESSAGES_QUERY = (
+    "MATCH (s:Session {id: $session_id})-[:LAST_MESSAGE]->(last_message) "
+    "MATCH p=(last_message)<-[:NEXT*0..%d]-() "
+    "WITH p ORDER BY length(p) DESC LIMIT 1 "
+    "UNWIND reverse(nodes(p)) AS node "
+    "RETURN node.type AS type, node.content AS content"
+)
+
+Message = namedtuple("Message", "type content")
+
+
+class HistoryWriter:
+    """Write-behind persistence of chat messages to Neo4j.
+
+    Messages from every session are queued and committed by one background
+    thread, a batch per transaction, so answering a question never waits
+    for a history write. close() (called on shutdown) commits what is left.
+    """
+
+    def __init__(self, database: str = HISTORY_DATABASE):
+        self.database = database
+        self._writes = queue.Queue()
+        self._writer = None
+        self._lock = threading.Lock()
+        self._closed = False
+        # session id -> messages queued but not written yet
+        self._queued = {}
+
+    def submit(self, session_id: str, role: str, content: str):
+        """Queue a message; it is written in order with the session's others."""
+        if self._closed:
+            print(f"History writer is closed, dropping a {role} message of session {session_id}")
+            return
+        with self._lock:
+            self._queued[session_id] = self._queued.get(session_id, 0) + 1
+        self._writes.put((session_id, role, content))
+        self._ensure_writer()
+
+    def pending(self, session_id: str = None) -> int:
+        """Messages not written yet, of one session or of all of them"""
+        with self._lock:
+            return self._queued.get(session_id, 0) if session_id is not None else sum(self._queued.values())
+
+    def _ensure_writer(self):
+        if self._writer is None:
+            with self._lock:
+                if self._writer is None:
+                    self._writer = threading.Thread(target=self._write_loop, name="kg-history-writer", daemon=True)
+                    self._writer.start()
+                    atexit.register(self.close)
+
+    def _write_loop(self):
+        while True:
+            item = self._writes.get()
+            if item is None:
+                self._writes.task_done()
+                return
+            batch = [item]
+            deadline = time.monotonic() + KG_HISTORY_FLUSH_INTERVAL
+            while len(batch) < HISTORY_BATCH_SIZE:
+                try:
+                    item = self._writes.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if item is None:
+                    # Let the loop see the stop marker after this batch
+                    self._writes.put(None)
+                    self._writes.task_done()
+                    break
+                batch.append(item)
+            self._write_batch(batch)
+            with self._lock:
+                for session_id, _, _ in batch:
+                    self._queued[session_id] -= 1
+                    if not self._queued[session_id]:
+                        del self._queued[session_id]
+            for _ in batch:
+                self._writes.task_done()
+
+    def _write_batch(self, batch):
+        """Commit a batch of queued messages in one transaction"""
+        def append(tx):
+            for session_id, role, content in batch:
+                tx.run(APPEND_MESSAGE_QUERY, session_id=session_id, type=role, content=content).consume()
+
+        for attempt in range(1, HISTORY_RETRIES + 1):
+            try:
+                with q_engine.get_driver().session(database=self.database) as session:
+                    session.execute_write(append)
+                return
+            except Exception as e:
+                print(f"Error writing {len(batch)} history messages (attempt {attempt}/{HISTORY_RETRIES}): {e}")
+                if attempt < HISTORY_RETRIES:
+                    time.sleep(attempt)
+
+    def flush(self):
+        """Block until every queued message is committed (or given up on)."""
+        if self._writer is not None:
+            self._writes.join()
+
+    def close(self):
+        """Commit queued messages and stop the writer thread."""
+        if self._closed:
+            return
+        self._closed = True
+        if self._writer is not None and self._writer.is_alive():
+            self._writes.put(None)
+            self._writer.join()
+
+
+history_writer = HistoryWriter()
+
+
+class SessionHistory:
+    """The recent messages of one chat session.
+
+    Keeps the last ``window`` messages in a ring buffer, loaded from Neo4j
+    once when the session is opened, and hands new messages to the
+    write-behind writer, so the cost per question does not grow with the
+    length of the conversation.
+    """
+
+    def __init__(self, session_id: str, window: int = None, writer: HistoryWriter = None, load: bool = True):
+        self.session_id = session_id
+        self.writer = writer or history_writer
+        self._messages = deque(maxlen=window or KG_HISTORY_WINDOW)
+        self._lock = threading.Lock()
+        if load:
+            self._load()
+
+    def _load(self):
+        # Messages of this session may still be queued
+        if self.writer.pending(self.session_id):
+            self.writer.flush()
+        try:
+            records, _, _ = q_engine.get_driver().execute_query(
+                RECENT_MESSAGES_QUERY % (self._messages.maxlen - 1),
+                {"session_id": self.session_id},
+                database_=self.writer.database,
+            )
+        except Exception as e:
+            print(f"Could not load the history of session {self.session_id}: {e}")
+            return
+        with self._lock:
+            self._messages.extend(Message(record["type"], record["content"]) for record in records)
+
+    @property
+    def messages(self):
+        """The buffered messages, oldest first"""
+        with self._lock:
+            return list(self._messages)
+
+    def add_message(self, role: str, content: str):
+        with self._lock:
+            self._messages.append(Message(role, content))
+            # Queued under the lock so concurrent turns keep their order
+            self.writer.submit(self.session_id, role, content)
+
+    def add_user_message(self, content: str):
+        self.add_message("human", content)
+
+    def add_ai_message(self, content: str):
+        self.add_message("ai", content)
+
+    def add_turn(self, question: str, answer: str):
+        """Add a question and its answer as adjacent messages"""
+        with self._lock:
+            for role, content in (("human", question), ("ai", answer)):
+                self._messages.append(Message(role, content))
+                self.writer.submit(self.session_id, role, content)
+
+
+class SessionPool:
+    """Open SessionHistory objects keyed by client session id.
+
+    Least recently used sessions are closed beyond ``max_sessions`` and any
+    session unused for ``idle_seconds``. Closing only drops the in-memory
+    window; the messages are in Neo4j and reloaded if the client returns.
+    """
+
+    def __init__(self, max_sessions: int = None, idle_seconds: float = None, writer: HistoryWriter = None):
+        self.max_sessions = KG_MAX_SESSIONS if max_sessions is None else max_sessions
+        self.idle_seconds = KG_SESSION_IDLE_SECONDS if idle_seconds is None else idle_seconds
+        self.writer = writer or history_writer
+        # session id -> (SessionHistory, last used), least recently used first
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def __contains__(self, session_id):
+        return session_id in self._sessions
+
+    def get(self, session_id: str, load: bool = True) -> SessionHistory:
+        """The session's history, opening (and loading) it if needed.
+
+        ``load=False`` skips the Neo4j read for a session id that was just
+        generated and so cannot have any history yet.
+        """
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry is not None:
+                self._sessions[session_id] = (entry[0], time.monotonic())
+                self._sessions.move_to_end(session_id)
+                return entry[0]
+        # Loading reads Neo4j, so it happens outside the lock
+        history = SessionHistory(session_id, writer=self.writer, load=load)
+        with self._lock:
+            # Another request may have opened the same session meanwhile
+            entry = self._sessions.get(session_id)
+            if entry is not None:
+                history = entry[0]
+            self._sessions[session_id] = (history, time.monotonic())
+            self._sessions.move_to_end(session_id)
+            self._evict()
+        return history
+
+    def _evict(self):
+        """Close idle and surplus sessions; called with the lock held"""
+        cutoff = time.monotonic() - self.idle_seconds if self.idle_seconds > 0 else None
+        while self._sessions:
+            session_id, (_, last_used) = next(iter(self._sessions.items()))
+            if len(self._sessions) > max(1, self.max_sessions) or (cutoff is not None and last_used < cutoff):
+                del self._sessions[session_id]
+            else:
+                break
+
+    def close(self, session_id: str):
+        with self._lock:
+            self._sessions.pop(session_id, None)
@@ -1,16 +1,23 @@
 
 
+import asyncio
+import json
 import os
 import threading
+import time
 from uuid import uuid4
 from dotenv import load_dotenv
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_openai import ChatOpenAI
 from langchain_neo4j import (
     Neo4jGraph,
-    Neo4jChatMessageHistory,
     GraphCypherQAChain
 )
+from langchain_neo4j.chains.graph_qa.cypher import extract_cypher
+from neo4j import Query
+
+# Load environment variables before the modules below read them at import
+load_dotenv()
 
 # from cypher_prompt_template import CYPHER_RECOMMENDATION_PROMPT
 # from qa_prompt_template import QA_PROMPT
@@ -18,32 +25,50 @@ from langchain_neo4j import (
 from api.kg_rag.cypher_prompt_template import CYPHER_GENERATION_PROMPT
 from api.kg_rag.qa_prompt_template import QA_PROMPT
 from api.kg_rag.cache import Cache
-from api.kg_rag.cache import cacheable
-
-# Load environment variables
-load_dotenv()
+from api.kg_rag.history import SessionPool
+from api.kg_rag.cache import cache_bypassed, cacheable, flight_key, lookup_cached, store_result
+from api.kg_rag import cypher_guard, cypher_templates, q_engine, warmup
 
 assistant = None
 
+GRAPH_VERSION_KEY = "graph_version"
+GRAPH_DATABASE = "neo4j"
+# Seconds a worker trusts its copy of the shared graph version
+KG_GRAPH_VERSION_TTL = float(os.getenv("KG_GRAPH_VERSION_TTL", "2"))
+
+def normalize_cypher(cypher: str) -> str:
+    """Cypher with insignificant whitespace and a trailing semicolon removed"""
+    return " ".join(cypher.split()).rstrip(";").strip()
+
+def result_key(cypher: str, graph_version: int, params: dict = None) -> str:
+    """Result cache key: graph version, normalized Cypher and bound parameters"""
+    key = f"{graph_version}:{normalize_cypher(cypher)}"
+    return f"{key} {json.dumps(params, sort_keys=True, default=str)}" if params else key
+
+def query_step(cypher: str, params: dict = None) -> dict:
+    return {"query": cypher, "params": params} if params else {"query": cypher}
+
 class Neo4jGraphChatAssistant:
-    def __init__(self, session_id: str):
+    """Graph, chain and caches shared by every chat session.
+
+    The only per-session state is the chat history, kept in ``sessions``;
+    ``session_id`` is used for questions asked without one.
+    """
+    def __init__(self, session_id: str = None):
+        self.session_id = session_id or f"factory_session_{uuid4()}"
         # Initialize Neo4j Graph connection
         self.graph = Neo4jGraph(
             url=os.getenv("NEO4J_URI"),
             username=os.getenv("NEO4J_USERNAME"),
             password=os.getenv("NEO4J_PASSWORD"),
-            database="neo4j",
+            database=GRAPH_DATABASE,
             enhanced_schema=True,
-            refresh_schema=False  # Disable schema refresh to avoid APOC dependency
+            refresh_schema=False,  # Disable schema refresh to avoid APOC dependency
+            timeout=cypher_guard.KG_QUERY_TIMEOUT,  # Neo4j ends longer transactions
         )
         
-        # Initialize Neo4j-backed chat history
-        self.history = Neo4jChatMessageHistory(
-            session_id=session_id,
-            url=os.getenv("NEO4J_URI"),  
-            username=os.getenv("NEO4J_USERNAME"),
-            password=os.getenv("NEO4J_PASSWORD")
-        )
+        # Recent messages of each open session, persisted to Neo4j in the background
+        self.sessions = SessionPool()
         
         # Configure domain-specific prompts
         self.cypher_prompt = CYPHER_GENERATION_PROMPT
@@ -57,47 +82,192 @@ class Neo4jGraphChatAssistant:
             cypher_prompt=self.cypher_prompt,
             qa_prompt=self.qa_prompt,
             verbose=True,
+            # Queries are run by run_cypher(), which validates them first
             allow_dangerous_requests=True,
             return_intermediate_steps=True,
         )
         
-        # Initialize cache
+        # Initialize caches: final answers, question -> generated Cypher, and
+        # Cypher -> Neo4j rows for the current graph data version
         self.cache = Cache()
+        self.cypher_cache = Cache(name="cypher")
+        self.result_cache = Cache(name="results", semantic=False)
+        # (version, monotonic time it was read); see graph_version
+        self._graph_version = (self._stored_graph_version(), time.monotonic())
+        self._graph_version_lock = threading.Lock()
+
+    def _stored_graph_version(self) -> int:
+        return int(self.result_cache.get_meta(GRAPH_VERSION_KEY, "0"))
+
+    @property
+    def graph_version(self) -> int:
+        """Graph data version shared by every worker through ``cache_meta``.
+
+        Re-read at most every KG_GRAPH_VERSION_TTL seconds. When another
+        worker has invalidated, this worker's answer cache (queued writes
+        and semantic index included) is dropped as well.
+        """
+        version, checked = self._graph_version
+        if time.monotonic() - checked < KG_GRAPH_VERSION_TTL:
+            return version
+        with self._graph_version_lock:
+            stored = self._stored_graph_version()
+            if stored != self._graph_version[0]:
+                self.cache.clear()
+                print(f"Knowledge graph version changed to {stored} in another worker, answers dropped")
+            self._graph_version = (stored, time.monotonic())
+        return stored
 
-    def _format_history(self) -> str:
+    @property
+    def history(self):
+        """History of the default session"""
+        return self.sessions.get(self.session_id)
+
+    def _format_history(self, session_id: str = None) -> str:
         """Format last 3 exchanges for context"""
         return "\n".join(
             f"{msg.content}" 
-            for msg in self.history.messages[-5:] if msg.type == "ai" # 3 pairs of Q/A
+            for msg in self.sessions.get(session_id or self.session_id).messages if msg.type == "ai" # 3 pairs of Q/A
+        )
+
+    @cacheable('cypher_cache', key=flight_key)
+    def generate_cypher(self, question: str) -> str:
+        """LLM-generated Cypher for a question, cached by normalized question"""
+        generated_cypher = self.chain.cypher_generation_chain.invoke({
+            "question": question,
+            "schema": self.chain.graph_schema,
+        })
+        # Extract Cypher code if it is wrapped in backticks
+        generated_cypher = extract_cypher(generated_cypher)
+        if self.chain.cypher_query_corrector:
+            generated_cypher = self.chain.cypher_query_corrector(generated_cypher)
+        return generated_cypher
+
+    def plan_query(self, question: str):
+        """(cypher, params) from the template library, else LLM-generated Cypher and no params"""
+        matched = cypher_templates.match(question)
+        if matched is not None:
+            print(f"Matched Cypher template {matched.template.name}: {matched.params}")
+            return matched.cypher, matched.params
+        return self.generate_cypher(question), None
+
+    # Flights use the exact result key: "a > 5" and "a < 5" must not share one
+    @cacheable('result_cache', key=lambda cypher, graph_version, params=None: result_key(cypher, graph_version, params), flight_by=None)
+    def run_cypher(self, cypher: str, graph_version: int, params: dict = None) -> dict:
+        """Neo4j rows for a Cypher query and its parameters, cached per graph data version.
+
+        The query is validated, bounded and cost-checked first and runs in a
+        read transaction; see cypher_guard.guard().
+        """
+        cypher = cypher_guard.guard(cypher, params, self.explain)
+        rows = self.graph.query(cypher, params or {}, session_params={"default_access_mode": "READ"})
+        return {"context": rows[: self.chain.top_k]}
+
+    def explain(self, cypher: str, params: dict = None) -> dict:
+        """The EXPLAIN plan of a query; nothing is executed"""
+        _, summary, _ = q_engine.get_driver().execute_query(
+            Query(f"EXPLAIN {cypher}", timeout=cypher_guard.KG_QUERY_TIMEOUT),
+            params or {},
+            database_=GRAPH_DATABASE,
         )
+        return summary.plan
+
+    @cacheable()
+    def answer(self, question: str) -> dict:
+        """Run generation, retrieval and QA as separately cached steps"""
+        generated_cypher, params = self.plan_query(question)
+        print(f"Generated Cypher: {generated_cypher}")
+        # The corrector returns an empty query when it finds an invalid schema
+        context = self.run_cypher(generated_cypher, self.graph_version, params)["context"] if generated_cypher else []
+        final_result = self.chain.qa_chain.invoke({"question": question, "context": context})
+        return {
+            "query": question,
+            "result": final_result,
+            "intermediate_steps": [query_step(generated_cypher, params), {"context": context}],
+        }
+
+    def invalidate(self):
+        """Forget answers and Neo4j results after the graph data changed.
+
+        Generated Cypher only depends on the question and the schema, so it
+        stays cached; results of older graph versions are never looked up
+        again and age out of the result cache.
+        """
+        with self._graph_version_lock:
+            graph_version = self._stored_graph_version() + 1
+            self.result_cache.set_meta(GRAPH_VERSION_KEY, str(graph_version))
+            self._graph_version = (graph_version, time.monotonic())
+        self.cache.clear()
+        print(f"Knowledge graph results invalidated, graph version is now {graph_version}")
+        return graph_version
+
+    def stream_answer(self, question: str):
+        """Yield ("cypher", step), ("token", text)... and finally ("done", result).
+
+        Same pipeline and caches as answer(), but the QA answer is streamed
+        token by token so clients see progress as soon as the graph query runs.
+        A cached answer is replayed as a single token.
+        """
+        bypass = cache_bypassed()
+        graph_version = self.graph_version
+        cached_result = None if bypass else lookup_cached(self.cache, question)
+        if cached_result:
+            yield "cypher", (cached_result.get("intermediate_steps") or [{}])[0]
+            yield "token", cached_result["result"]
+            yield "done", cached_result
+            return
+
+        generated_cypher, params = self.plan_query(question)
+        yield "cypher", query_step(generated_cypher, params)
+        context = self.run_cypher(generated_cypher, graph_version, params)["context"] if generated_cypher else []
+        tokens = []
+        for token in self.chain.qa_chain.stream({"question": question, "context": context}):
+            tokens.append(token)
+            yield "token", token
+        result = {
+            "query": question,
+            "result": "".join(tokens),
+            "intermediate_steps": [query_step(generated_cypher, params), {"context": context}],
+        }
+        if not bypass:
+            self.cache.count("misses")
+            store_result(self.cache, question, result)
+        yield "done", result
 
-    def query(self, question: str) -> str:
+    def _persist(self, question: str, answer: str, session_id: str = None, new_session: bool = False):
+        print("Persisting conversation... : " + answer)
+        self.sessions.get(session_id or self.session_id, load=not new_session).add_turn(question, answer)
+
+    def query(self, question: str, session_id: str = None, new_session: bool = False) -> str:
         try:
-            # Execute chain with context
-            hist = self._format_history()
-            print("HISTORY TO BE USED:" +str(hist))
-            result = self.chain.invoke({
-                "query": question,
-                #"history": hist,
-            })
+            # Picks up an invalidation by another worker before the answer cache is read
+            self.graph_version
+            # Execute the cached pipeline
+            result = self.answer(question)
             
             # Persist conversation
-            print("Persisting conversation... : "+ str(result))
-            self.history.add_user_message(question)
-            self.history.add_ai_message(result["result"])
+            self._persist(question, result["result"], session_id, new_session)
             
             return result
         
         except Exception as e:
-            print(f"Research error: {str(e)}")
-            import traceback
-            print(f"Full error traceback: {traceback.format_exc()}")
-            return {"result": f"An error occurred while processing your query: {str(e)}. Please try again or contact support."}
+            return {"result": error_message(e)}
+
+    def query_stream(self, question: str, session_id: str = None, new_session: bool = False):
+        """stream_answer() plus history persistence, with errors as an ("error", ...) event"""
+        try:
+            for event, data in self.stream_answer(question):
+                if event == "done":
+                    self._persist(question, data["result"], session_id, new_session)
+                yield event, data
+        except Exception as e:
+            yield "error", {"message": error_message(e)}
 
     def __del__(self):
-        # Close the cache connection when the object is garbage collected
-        if hasattr(self, 'cache'):
-            self.cache.close()
+        # Close the cache connections when the object is garbage collected
+        for name in ('cache', 'cypher_cache', 'result_cache'):
+            if hasattr(self, name):
+                getattr(self, name).close()
 
 import inspect
 lock = threading.Lock()
@@ -112,16 +282,34 @@ async def init_graph( ):
         with lock:
             if assistant is None:     
                 print("Initializing Neo4j Graph Chat ASSISTANT...")  
-                session_id = f"factory_session_{uuid4()}"
-                assistant = Neo4jGraphChatAssistant(session_id)
+                assistant = Neo4jGraphChatAssistant()
+                warmup.start_warmup(assistant)
             print("Releasing lock")
 
 from neo4j.exceptions import CypherSyntaxError
 
-def get_kg_answer(question):
+def invalidate_graph_results():
+    """Call after the Neo4j data changes; returns the new graph version, or None"""
+    if assistant is None:
+        return None
+    # Before the answers are dropped, so a running warm-up cannot store stale ones after
+    warmup.cancel_warmup()
+    graph_version = assistant.invalidate()
+    # The answers were just dropped; recompute the common ones right away
+    warmup.start_warmup(assistant)
+    return graph_version
+
+def error_message(e: Exception) -> str:
+    print(f"Research error: {str(e)}")
+    import traceback
+    print(f"Full error traceback: {traceback.format_exc()}")
+    return f"An error occurred while processing your query: {str(e)}. Please try again or contact support."
+
+def get_kg_answer(question, session_id=None, new_session=False):
     global assistant
     if assistant is None:
-        init_graph()
+        # Runs on a bot worker thread, which has no event loop of its own
+        asyncio.run(init_graph())
     
     # Check if bypass_cache is set in session state
     # bypass_cache = False
@@ -129,8 +317,14 @@ def get_kg_answer(question):
     #     bypass_cache = st.session_state.bypass_cache
     
     # Use the assistant's query method which handles caching
-    result = assistant.query(question)
+    result = assistant.query(question, session_id, new_session)
     return result
+
+def stream_kg_answer(question, session_id=None, new_session=False):
+    """Generator of (event, data) pairs for a streamed answer, see query_stream()"""
+    if assistant is None:
+        asyncio.run(init_graph())
+    yield from assistant.query_stream(question, session_id, new_session)
     
 # Example Usage
 if __name__ == "__main__":
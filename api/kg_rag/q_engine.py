@@ -1,20 +1,37 @@
 import os
+import threading
 from neo4j import GraphDatabase
 
 
-URI = os.getenv("NEO4J_URI")
-DB = os.getenv("NEO4J_DB")
-AUTH = (os.getenv("NEO4J_USERNAME"), os.getenv("NEO4J_PASSWORD"))
+_driver = None
+_lock = threading.Lock()
 
-driver = GraphDatabase.driver(URI, auth=AUTH)
-driver.verify_connectivity()
-print("Connection established.")
+def get_driver():
+    """The shared Neo4j driver, connected on first use rather than at import.
+
+    Credentials are read here, not at import, so ones loaded from .env
+    after this module was imported are still picked up.
+    """
+    global _driver
+    if _driver is None:
+        with _lock:
+            if _driver is None:
+                auth = (os.getenv("NEO4J_USERNAME"), os.getenv("NEO4J_PASSWORD"))
+                driver = GraphDatabase.driver(os.getenv("NEO4J_URI"), auth=auth)
+                driver.verify_connectivity()
+                print("Connection established.")
+                _driver = driver
+    return _driver
 
 def execute_query(query):
-    result = driver.execute_query(query, database_ = DB)
+    result = get_driver().execute_query(query, database_ = os.getenv("NEO4J_DB"))
     print(result)
     return result
 
 def close():
-    driver.close()
+    global _driver
+    with _lock:
+        if _driver is not None:
+            _driver.close()
+            _driver = None
 
@@ -0,0 +1,197 @@
+import math
+import os
+import re
+import threading
+import zlib
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+KG_SEMANTIC_CACHE = os.getenv("KG_SEMANTIC_CACHE", "0").lower() in ("1", "true", "yes", "on")
+# Minimum cosine similarity for a paraphrase to reuse a cached answer
+KG_SEMANTIC_THRESHOLD = float(os.getenv("KG_SEMANTIC_THRESHOLD", "0.85"))
+KG_SEMANTIC_MAX_ENTRIES = int(os.getenv("KG_SEMANTIC_MAX_ENTRIES", "10000"))
+
+# Features are hashed into this many buckets, so the vocabulary never grows
+HASH_BUCKETS = 1 << 20
+CHAR_NGRAM = 3
+
+STOPWORDS = {
+    "a", "an", "the", "is", "are", "was", "were", "be", "of", "for", "in", "on", "at", "to",
+    "what", "whats", "which", "who", "how", "please", "tell", "show", "me", "give", "can",
+    "you", "i", "we", "our", "us", "do", "does", "there", "current", "currently",
+}
+
+# Words that flip or narrow the meaning of an otherwise similar question
+# ("highest" vs "lowest"); they must match exactly between paraphrases
+GUARD_WORDS = {
+    "highest", "lowest", "higher", "lower", "most", "least", "more", "less", "fewer", "fewest",
+    "best", "worst", "better", "worse", "top", "bottom", "max", "maximum", "min", "minimum",
+    "above", "below", "over", "under", "greater", "smaller", "increase", "decrease",
+    "increased", "decreased", "before", "after", "first", "last", "earliest", "latest",
+    "ascending", "descending", "not", "without", "total", "average",
+}
+# Nouns whose next word names a specific thing: "location a", "shift night"
+ENTITY_NOUNS = {"factory", "location", "type", "shift", "team", "member", "machine", "supplier", "product", "batch", "line"}
+# Names that are entities on their own
+ENTITY_NAMES = {
+    "january", "february", "march", "april", "may", "june", "july", "august", "september",
+    "october", "november", "december", "monday", "tuesday", "wednesday", "thursday", "friday",
+    "saturday", "sunday", "yesterday", "today", "week", "month", "quarter", "year",
+}
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(question: str) -> List[str]:
+    """Lower-cased words of a question, without punctuation"""
+    return _TOKEN.findall(question.lower().replace("'", ""))
+
+
+def normalize(question: str) -> List[str]:
+    """Lower-cased content words of a question, without punctuation or stopwords"""
+    tokens = tokenize(question)
+    return [token for token in tokens if token not in STOPWORDS] or tokens
+
+
+def _bucket(feature: str) -> int:
+    # crc32 rather than hash(): stable across processes and restarts
+    return zlib.crc32(feature.encode("utf-8")) % HASH_BUCKETS
+
+
+def features(tokens: List[str]) -> Dict[int, float]:
+    """Hashed word unigram/bigram and character trigram counts"""
+    counts: Dict[int, float] = {}
+    grams = [f"w:{token}" for token in tokens]
+    grams += [f"b:{first} {second}" for first, second in zip(tokens, tokens[1:])]
+    for token in tokens:
+        padded = f" {token} "
+        grams += [f"c:{padded[i:i + CHAR_NGRAM]}" for i in range(len(padded) - CHAR_NGRAM + 1)]
+    for gram in grams:
+        bucket = _bucket(gram)
+        counts[bucket] = counts.get(bucket, 0.0) + 1.0
+    return counts
+
+
+def _entities(tokens: List[str]):
+    """Tokens that must match exactly between paraphrases.
+
+    Numbers ('factory 1' is no paraphrase of 'factory 2'), comparison and
+    ranking words ('highest' vs 'lowest'), the name after an entity noun
+    ('location a' vs 'location b', kept even when it is a stopword) and
+    month or period names. Takes tokenize() output, stopwords included.
+    """
+    entities = {token for token in tokens if any(ch.isdigit() for ch in token) or token in GUARD_WORDS or token in ENTITY_NAMES}
+    entities.update(f"{noun}:{name}" for noun, name in zip(tokens, tokens[1:]) if noun in ENTITY_NOUNS)
+    return frozenset(entities)
+
+
+class SemanticIndex:
+    """TF-IDF index of cached questions for paraphrase-tolerant lookups.
+
+    Questions are reduced to hashed word and character n-gram features, and
+    weighted by sublinear TF times IDF when they are added. Lookups only
+    touch the posting lists of the query's features in an inverted index,
+    so their cost depends on the overlap rather than on the index size. The
+    best match is returned when its cosine similarity reaches ``threshold``
+    and it names the same entities and comparisons (see _entities()).
+    Everything is pure Python and local; nothing leaves the process.
+    """
+
+    def __init__(self, threshold: float = None, max_entries: int = None):
+        self.threshold = KG_SEMANTIC_THRESHOLD if threshold is None else threshold
+        self.max_entries = KG_SEMANTIC_MAX_ENTRIES if max_entries is None else max_entries
+        self._lock = threading.Lock()
+        # question -> (weights, entities), oldest first
+        self._entries = OrderedDict()
+        self._postings: Dict[int, Dict[str, float]] = {}
+        self._document_frequency: Dict[int, int] = {}
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _idf(self, bucket: int) -> float:
+        total = len(self._entries)
+        return math.log((1 + total) / (1 + self._document_frequency.get(bucket, 0))) + 1.0
+
+    def _weights(self, counts: Dict[int, float]) -> Dict[int, float]:
+        weights = {bucket: (1.0 + math.log(count)) * self._idf(bucket) for bucket, count in counts.items()}
+        norm = math.sqrt(sum(weight * weight for weight in weights.values())) or 1.0
+        return {bucket: weight / norm for bucket, weight in weights.items()}
+
+    def add(self, question: str):
+        """Index a question whose answer is in the exact-match cache"""
+        tokens = normalize(question)
+        if not tokens:
+            return
+        counts = features(tokens)
+        with self._lock:
+            if question in self._entries:
+                self._entries.move_to_end(question)
+                return
+            for bucket in counts:
+                self._document_frequency[bucket] = self._document_frequency.get(bucket, 0) + 1
+            weights = self._weights(counts)
+            self._entries[question] = (weights, _entities(tokenize(question)))
+            for bucket, weight in weights.items():
+                self._postings.setdefault(bucket, {})[question] = weight
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+
+    def remove(self, question: str):
+        """Drop a question, e.g. after its answer left the exact-match cache"""
+        with self._lock:
+            if question in self._entries:
+                self._remove(question)
+
+    def _remove(self, question: str):
+        weights, _ = self._entries.pop(question)
+        for bucket in weights:
+            postings = self._postings.get(bucket)
+            if postings is not None:
+                postings.pop(question, None)
+                if not postings:
+                    del self._postings[bucket]
+            frequency = self._document_frequency.get(bucket, 0) - 1
+            if frequency > 0:
+                self._document_frequency[bucket] = frequency
+            else:
+                self._document_frequency.pop(bucket, None)
+
+    def lookup(self, question: str) -> Optional[str]:
+        """The indexed question most similar to ``question``, if similar enough"""
+        tokens = normalize(question)
+        if not tokens:
+            return None
+        entities = _entities(tokenize(question))
+        counts = features(tokens)
+        with self._lock:
+            if not self._entries:
+                return None
+            weights = self._weights(counts)
+            scores: Dict[str, float] = {}
+            # Rarest (heaviest) features first. Vectors are unit length, so once
+            # the query weight left is below the threshold no new candidate can
+            # reach it, and the common features only update known candidates.
+            remaining = 1.0
+            for bucket, weight in sorted(weights.items(), key=lambda item: item[1], reverse=True):
+                postings = self._postings.get(bucket)
+                if postings:
+                    if math.sqrt(max(remaining, 0.0)) >= self.threshold:
+                        for candidate, candidate_weight in postings.items():
+                            scores[candidate] = scores.get(candidate, 0.0) + weight * candidate_weight
+                    elif len(scores) < len(postings):
+                        for candidate in scores:
+                            candidate_weight = postings.get(candidate)
+                            if candidate_weight:
+                                scores[candidate] += weight * candidate_weight
+                    else:
+                        for candidate, candidate_weight in postings.items():
+                            if candidate in scores:
+                                scores[candidate] += weight * candidate_weight
+                remaining -= weight * weight
+            for candidate, score in sorted(scores.items(), key=lambda item: item[1], reverse=True):
+                if score < self.threshold:
+                    break
+                if self._entries[candidate][1] == entities:
+                    return candidate
+        return None
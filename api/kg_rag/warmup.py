@@ -0,0 +1,101 @@
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from api.kg_rag.cache import store_result
+
+# Off by default: every worker runs its own warm-up, an LLM call per question
+KG_WARMUP = os.getenv("KG_WARMUP", "0").lower() in ("1", "true", "yes", "on")
+KG_WARMUP_CATALOGUE = os.getenv("KG_WARMUP_CATALOGUE", str(Path(__file__).with_name("warmup_questions.json")))
+# Questions answered at once; each one is an LLM call plus a Neo4j query
+KG_WARMUP_CONCURRENCY = int(os.getenv("KG_WARMUP_CONCURRENCY", "2"))
+
+_lock = threading.Lock()
+_generation = 0
+
+
+def load_catalogue(path=None):
+    """Questions to pre-answer: a JSON list of strings, or {"questions": [...]}"""
+    path = path or KG_WARMUP_CATALOGUE
+    try:
+        with open(path, encoding="utf-8") as f:
+            catalogue = json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"Could not read warm-up catalogue {path}: {e}")
+        return []
+    if isinstance(catalogue, dict):
+        catalogue = catalogue.get("questions", [])
+    # Order-preserving de-duplication
+    return list(dict.fromkeys(q.strip() for q in catalogue if isinstance(q, str) and q.strip()))
+
+
+def warm_up(assistant, questions, concurrency=None, generation=None):
+    """Answer every question that is not cached yet, a few at a time.
+
+    Stops early when a newer warm-up run has been started or the graph
+    version changed (an invalidation), since its answers would be stale; an
+    answer that was computed meanwhile is discarded rather than stored.
+    Returns counts of warmed, already cached, discarded and failed questions.
+    """
+    counts = {"warmed": 0, "cached": 0, "discarded": 0, "failed": 0}
+    counts_lock = threading.Lock()
+
+    def current(graph_version):
+        return (generation is None or generation == _generation) and assistant.graph_version == graph_version
+
+    def warm(question):
+        graph_version = assistant.graph_version
+        if not current(graph_version):
+            return
+        if assistant.cache.get(question) is not None:
+            outcome = "cached"
+        else:
+            try:
+                # The uncached pipeline, so the answer is stored only if no
+                # invalidation happened while it was computed
+                result = assistant.answer.__wrapped__(assistant, question)
+                if current(graph_version):
+                    store_result(assistant.cache, question, result)
+                    outcome = "warmed"
+                else:
+                    outcome = "discarded"
+            except Exception as e:
+                print(f"Warm-up failed for question: {question}: {e}")
+                outcome = "failed"
+        with counts_lock:
+            counts[outcome] += 1
+
+    with ThreadPoolExecutor(max_workers=max(1, concurrency or KG_WARMUP_CONCURRENCY), thread_name_prefix="kg-warmup") as pool:
+        list(pool.map(warm, questions))
+    return counts
+
+
+def cancel_warmup():
+    """Make running warm-ups stop and discard what they compute"""
+    global _generation
+    with _lock:
+        _generation += 1
+
+
+def start_warmup(assistant, path=None):
+    """Warm the answer cache from the catalogue on a daemon thread"""
+    global _generation
+    if not KG_WARMUP:
+        return None
+    with _lock:
+        _generation += 1
+        generation = _generation
+
+    def run():
+        questions = load_catalogue(path)
+        if not questions:
+            return
+        print(f"Warming the answer cache with {len(questions)} questions...")
+        counts = warm_up(assistant, questions, generation=generation)
+        print(f"Answer cache warm-up finished: {counts}")
+
+    thread = threading.Thread(target=run, name="kg-warmup", daemon=True)
+    thread.start()
+    return thread
@@ -1,17 +1,48 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 from fastapi.staticfiles import StaticFiles
 import os
 import threading
 import asyncio
 
+try:
+    from dotenv import load_dotenv
+except ImportError:  # python-dotenv comes with the knowledge-graph extras
+    load_dotenv = None
+
+# Settings are read when the modules below are imported (the KG cache via
+# the bot routes), so .env has to be loaded first
+if load_dotenv is not None:
+    load_dotenv()
+
 from api.routes.factory_routes import router as factory_router
 from api.routes.bot_routes import router as bot_router
 from api.routes.frontend_routes import router as frontend_router
-from api.services.kg_rag_service import initialize_graph
+from api.services.kg_rag_service import initialize_graph, flush_history
+from api.services.data_store import data_store
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Load the factory data in the background so the worker accepts
+    # connections immediately; /ready reports when it can serve traffic.
+    tail_interval = os.getenv("FACTORY_TAIL_INTERVAL")
+    data_store.start_loading(float(tail_interval) if tail_interval else None)
+
+    # Warm the knowledge graph stack in a separate thread so the first bot
+    # question does not pay for it; with KG_WARM_START=0 it is imported when
+    # the first graph question arrives instead
+    if os.getenv("KG_WARM_START", "1").lower() in ("1", "true", "yes", "on"):
+        thread = threading.Thread(target=initialize_graph, daemon=True)
+        thread.start()
+    yield
+
+    # Chat history is written behind the answers; don't lose the tail
+    flush_history()
 
 # Create FastAPI app
-app = FastAPI(title="Factory Management API")
+app = FastAPI(title="Factory Management API", lifespan=lifespan)
 
 # Configure CORS
 app.add_middleware(
@@ -22,7 +53,18 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Include routers
+@app.get("/ready", tags=["health"])
+async def ready():
+    """Readiness probe: 200 once the factory data is loaded, 503 while loading or after a failure"""
+    if data_store.ready:
+        return {"status": "ready", "version": data_store.snapshot.version}
+    return JSONResponse(
+        status_code=503,
+        content={"status": data_store.state, "error": data_store.error},
+        headers={"Retry-After": "5"},
+    )
+
+# Include routers (the frontend catch-all must stay last)
 app.include_router(factory_router, prefix="/api/factory", tags=["factory"])
 app.include_router(bot_router, prefix="/api/factory", tags=["bot"])
 app.include_router(frontend_router, tags=["frontend"])
@@ -30,10 +72,6 @@ app.include_router(frontend_router, tags=["frontend"])
 # Mount static files
 app.mount("/static", StaticFiles(directory="api/static"), name="static")
 
-# Initialize the knowledge graph in a separate thread
-thread = threading.Thread(target=initialize_graph, daemon=True)
-thread.start()
-
 if __name__ == "__main__":
     import uvicorn
     
@@ -1,4 +1,4 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from typing import List, Optional, Dict, Any, Union
 
 class TimeSeriesData(BaseModel):
@@ -21,9 +21,30 @@ class FactoryStatus(BaseModel):
     efficiency: str
     lastMaintenance: str
 
+class IngestRequest(BaseModel):
+    rows: List[Dict[str, Any]]
+
+class IngestResponse(BaseModel):
+    ingested: int
+    totalRows: int
+    version: int
+
 class BotMessageRequest(BaseModel):
     message: str
+    # Conversation to continue; a new one is started when omitted
+    sessionId: Optional[str] = Field(None, min_length=1, max_length=128)
 
 class BotResponse(BaseModel):
     message: str
+    sessionId: str
+
+class CacheStats(BaseModel):
+    hits: int
+    semantic_hits: int
+    misses: int
+    coalesced: int
+    hit_rate: float
+    in_flight: int
+    pending_writes: int
+    semantic_entries: int
 
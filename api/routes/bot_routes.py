@@ -1,14 +1,102 @@
-from fastapi import APIRouter, HTTPException
-from api.models.factory_models import BotMessageRequest, BotResponse
-from api.services.kg_rag_service import get_bot_response
+from fastapi import APIRouter, Header, HTTPException
+from fastapi.responses import StreamingResponse
+from typing import Optional
+from api.kg_rag.cache import bypass_cache
+from api.models.factory_models import BotMessageRequest, BotResponse, CacheStats
+from api.services.kg_rag_service import (
+    BotBusy,
+    answer_locally,
+    get_bot_response_async,
+    get_cache_stats,
+    invalidate_graph_cache,
+    new_session_id,
+    start_bot_stream,
+)
+from api.services.live_stream import format_event
+from api.services.serialization import dumps
 
 router = APIRouter()
 
+def wants_bypass(header: Optional[str]) -> bool:
+    return header is not None and header.strip().lower() in ("1", "true", "yes", "on")
+
 @router.post("/bot", response_model=BotResponse)
-async def send_bot_message(request: BotMessageRequest):
-    response_content = get_bot_response(request.message)
+async def send_bot_message(
+    request: BotMessageRequest,
+    x_bypass_cache: Optional[str] = Header(None, description="'true' to skip the answer caches for this question"),
+):
+    new_session = request.sessionId is None
+    session_id = request.sessionId or new_session_id()
+    # The answer is computed on the bot pool; the event loop keeps serving
+    # the dashboard meanwhile
+    with bypass_cache(wants_bypass(x_bypass_cache)):
+        try:
+            response_content = await get_bot_response_async(request.message, session_id, new_session)
+        except BotBusy as e:
+            raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
     
     return BotResponse(
-        message=response_content['result']
+        message=response_content['result'],
+        sessionId=session_id,
     )
 
+async def local_answer_events(result):
+    yield "token", result["result"]
+    yield "done", result
+
+async def bot_event_stream(events, session_id: str):
+    async for event, data in events:
+        if event == "cypher":
+            payload = {"status": "querying graph", "query": data.get("query")}
+        elif event == "token":
+            payload = {"token": data}
+        elif event == "done":
+            payload = {"message": data["result"], "sessionId": session_id}
+        else:
+            payload = data
+        yield format_event(event, dumps(payload))
+
+@router.post("/bot/stream")
+async def stream_bot_message(
+    request: BotMessageRequest,
+    x_bypass_cache: Optional[str] = Header(None, description="'true' to skip the answer caches for this question"),
+):
+    """Server-Sent Events version of POST /bot.
+
+    Emits ``cypher`` (the graph is being queried) once the Cypher query is
+    generated, ``token`` events as the answer is generated, then ``done``
+    with the full answer and the session id, or ``error``.
+    """
+    session_id = request.sessionId or new_session_id()
+    # Simple KPI questions are answered from the dashboard data right away
+    local = answer_locally(request.message)
+    if local is not None:
+        events = local_answer_events(local)
+    else:
+        # Start the answer before the response does, so "busy" is still a 503;
+        # the worker owns its slot and frees it when done, whatever the client does
+        with bypass_cache(wants_bypass(x_bypass_cache)):
+            try:
+                events = await start_bot_stream(request.message, session_id, request.sessionId is None)
+            except BotBusy as e:
+                raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
+    return StreamingResponse(
+        bot_event_stream(events, session_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no", "X-Session-Id": session_id},
+    )
+
+@router.get("/bot/cache-stats", response_model=CacheStats)
+async def bot_cache_stats():
+    stats = get_cache_stats()
+    if stats is None:
+        raise HTTPException(status_code=503, detail="The knowledge graph assistant is not initialized yet")
+    return CacheStats(**stats)
+
+@router.post("/bot/cache/invalidate")
+async def bot_cache_invalidate():
+    """Call after the knowledge graph data changed; generated Cypher stays cached"""
+    graph_version = invalidate_graph_cache()
+    if graph_version is None:
+        raise HTTPException(status_code=503, detail="The knowledge graph assistant is not initialized yet")
+    return {"graphVersion": graph_version}
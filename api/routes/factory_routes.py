@@ -1,33 +1,164 @@
-from fastapi import APIRouter, HTTPException
-from typing import List
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
+from typing import Dict, List, Literal, Optional
+from datetime import date
 
-from api.models.factory_models import FactoryMetrics, FactoryStatus
-from api.services.data_store import data_store
+import pandas as pd
+
+from api.models.factory_models import FactoryMetrics, FactoryStatus, IngestRequest, IngestResponse
+from api.services.cube import UnknownFilterValue
+from api.services.data_store import DataStoreNotReady, FactorySnapshot, data_store
+from api.services.live_stream import factory_event_stream
+from api.services.serialization import JSONBytesResponse, dumps
 
 router = APIRouter()
 
+# Every endpoint reads the current snapshot once, so a concurrent refresh can
+# never mix aggregates from two versions of the data in a single response.
+# Snapshot payloads are validated and encoded when the snapshot is built, so
+# the default responses are the cached bytes; response_model only documents them.
+
+def not_ready_error(error: DataStoreNotReady) -> HTTPException:
+    return HTTPException(
+        status_code=503,
+        detail={"status": data_store.state, "message": str(error)},
+        headers={"Retry-After": "5"},
+    )
+
+def current_snapshot() -> FactorySnapshot:
+    """Dependency resolving the snapshot, or an explicit 503 while data is loading"""
+    try:
+        return data_store.require_snapshot()
+    except DataStoreNotReady as e:
+        raise not_ready_error(e)
+
+def drilldown_filters(
+    factory: Optional[str] = Query(None, description="Only rows of this factory, e.g. 'Factory 1'"),
+    location: Optional[str] = Query(None, description="Only rows of this location, e.g. 'Location A'"),
+    machine_type: Optional[str] = Query(None, description="Only rows of this machine type, e.g. 'Type 2'"),
+    shift: Optional[str] = Query(None, description="Only rows of this shift"),
+) -> Dict[str, str]:
+    """Dependency collecting the drill-down filters that were supplied"""
+    filters = {"factory": factory, "location": location, "machine_type": machine_type, "shift": shift}
+    return {name: value for name, value in filters.items() if value is not None}
+
+def percentile_list(
+    percentiles: Optional[str] = Query(None, description="Comma-separated percentiles to include, e.g. '5,50,95'"),
+) -> List[float]:
+    """Dependency parsing the requested percentiles"""
+    if not percentiles:
+        return []
+    try:
+        return [float(p) for p in percentiles.split(",") if p.strip()]
+    except ValueError:
+        raise HTTPException(status_code=400, detail="percentiles must be comma-separated numbers")
+
+def check_window(start: Optional[date], end: Optional[date]):
+    if start is not None and end is not None and start > end:
+        raise HTTPException(status_code=400, detail="start must not be after end")
+
+def snapshot_response(snapshot: FactorySnapshot, body: bytes) -> JSONBytesResponse:
+    return JSONBytesResponse(body, headers={"X-Snapshot-Version": str(snapshot.version)})
+
 @router.get("/metrics", response_model=FactoryMetrics)
-async def get_factory_metrics():
-    metrics = data_store.get_factory_metrics()
-    return metrics
+async def get_factory_metrics(
+    snapshot: FactorySnapshot = Depends(current_snapshot),
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    resolution: Literal["day", "week", "month"] = "day",
+    points: Optional[int] = Query(None, ge=3, description="Downsample timeSeriesData to at most this many points"),
+    filters: Dict[str, str] = Depends(drilldown_filters),
+):
+    check_window(start, end)
+    if not filters and start is None and end is None and resolution == "day" and points is None:
+        return snapshot_response(snapshot, snapshot.encoded["metrics"])
+    try:
+        metrics = data_store.get_factory_metrics(start, end, resolution, points, filters, snapshot=snapshot)
+    except UnknownFilterValue as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return snapshot_response(snapshot, dumps(metrics))
 
 @router.get("/status", response_model=List[FactoryStatus])
-async def get_factory_status():
-    status = data_store.get_factory_status()
-    return status
+async def get_factory_status(
+    snapshot: FactorySnapshot = Depends(current_snapshot),
+    operational: Optional[float] = Query(None, description="Minimum utilization (%) for an operational line"),
+    warning: Optional[float] = Query(None, description="Minimum utilization (%) for a line in warning"),
+):
+    if operational is None and warning is None:
+        return snapshot_response(snapshot, snapshot.encoded["status"])
+    return snapshot_response(snapshot, dumps(data_store.get_factory_status(operational, warning, snapshot=snapshot)))
 
 @router.get("/machine-types")
-async def get_machine_types():
-    machine_types = data_store.get_machine_types()
-    return {"machine_types": machine_types}
+async def get_machine_types(snapshot: FactorySnapshot = Depends(current_snapshot)):
+    return snapshot_response(snapshot, snapshot.encoded["machine_types"])
 
 @router.get("/batch-quality")
-async def get_batch_quality():
-    batch_quality = data_store.get_batch_quality()
-    return batch_quality
+async def get_batch_quality(
+    snapshot: FactorySnapshot = Depends(current_snapshot),
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    filters: Dict[str, str] = Depends(drilldown_filters),
+    percentiles: List[float] = Depends(percentile_list),
+):
+    check_window(start, end)
+    if not filters and start is None and end is None and not percentiles:
+        return snapshot_response(snapshot, snapshot.encoded["batch_quality"])
+    try:
+        batch_quality = data_store.get_batch_quality(filters, start, end, percentiles, snapshot=snapshot)
+    except UnknownFilterValue as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return snapshot_response(snapshot, dumps(batch_quality))
 
 @router.get("/energy-metrics")
-async def get_energy_metrics():
-    energy_metrics = data_store.get_energy_metrics()
-    return energy_metrics
+async def get_energy_metrics(
+    snapshot: FactorySnapshot = Depends(current_snapshot),
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    filters: Dict[str, str] = Depends(drilldown_filters),
+    percentiles: List[float] = Depends(percentile_list),
+):
+    check_window(start, end)
+    if not filters and start is None and end is None and not percentiles:
+        return snapshot_response(snapshot, snapshot.encoded["energy_metrics"])
+    try:
+        energy_metrics = data_store.get_energy_metrics(filters, start, end, percentiles, snapshot=snapshot)
+    except UnknownFilterValue as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return snapshot_response(snapshot, dumps(energy_metrics))
+
+@router.get("/stream")
+async def stream_factory_updates(request: Request, snapshot: FactorySnapshot = Depends(current_snapshot)):
+    """Server-Sent Events replacing /metrics and /status polling.
+
+    Sends a ``snapshot`` event with the metrics and status on connect, then a
+    ``delta`` event (KPIs, changed lines, new or updated time-series points)
+    every time the factory data changes.
+    """
+    return StreamingResponse(
+        factory_event_stream(request, snapshot),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
+# A plain def route: FastAPI runs it on the threadpool, so the aggregation and
+# snapshot rebuild never block the event loop.
+@router.post("/ingest", response_model=IngestResponse)
+def ingest_rows(request: IngestRequest):
+    rows = pd.DataFrame(request.rows)
+    try:
+        snapshot = data_store.append_rows(rows)
+    except DataStoreNotReady as e:
+        raise not_ready_error(e)
+    except (ValueError, TypeError) as e:
+        raise HTTPException(status_code=422, detail=f"Could not ingest rows: {e}")
+    return IngestResponse(
+        ingested=len(rows),
+        totalRows=data_store.aggregates.row_count,
+        version=snapshot.version,
+    )
@@ -0,0 +1,145 @@
+import copy
+
+import numpy as np
+import pandas as pd
+
+from api.services import time_series
+from api.services.cube import AggregationCube
+from api.services.line_status import AGE_COLUMN, LINE_KEY, UTILIZATION_COLUMN, LatestStateIndex
+from api.services.sketches import DailySketches
+
+# Metric name -> CSV column for every running aggregate the dashboard serves
+METRIC_COLUMNS = {
+    "production": "Production Volume (units)",
+    "efficiency": "Machine Utilization (%)",
+    "downtime": "Machine Downtime (hours)",
+    "profitMargin": "Profit Margin (%)",
+    "quality": "Batch Quality (Pass %)",
+    "energyConsumption": "Energy Consumption (kWh)",
+    "energyEfficiency": "Energy Efficiency Rating",
+    "emissions": "CO2 Emissions (kg)",
+}
+
+# Metrics whose distribution (percentiles) is tracked with quantile sketches
+SKETCH_METRICS = ["quality", "energyConsumption", "energyEfficiency", "emissions"]
+
+
+class RunningStats:
+    """Count, mean, variance, min and max of one metric, updated batch by batch.
+
+    Batches are folded in with Chan's parallel form of Welford's algorithm, so
+    an update costs O(batch) and the result matches a single pass over all rows.
+    """
+    __slots__ = ("count", "mean", "m2", "min", "max")
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = float("nan")
+        self.max = float("nan")
+
+    def update(self, values):
+        """Fold a batch of values (NaNs ignored) into the running state"""
+        values = np.asarray(values, dtype="float64")
+        values = values[~np.isnan(values)]
+        if not values.size:
+            return
+        batch_mean = float(values.mean())
+        batch_m2 = float(((values - batch_mean) ** 2).sum())
+        self._combine(values.size, batch_mean, batch_m2, float(values.min()), float(values.max()))
+
+    def merge(self, other):
+        """Fold another RunningStats (e.g. from another partition) into this one"""
+        if other.count:
+            self._combine(other.count, other.mean, other.m2, other.min, other.max)
+
+    def _combine(self, count, mean, m2, minimum, maximum):
+        total = self.count + count
+        delta = mean - self.mean
+        self.mean += delta * count / total
+        self.m2 += m2 + delta * delta * self.count * count / total
+        self.min = minimum if self.count == 0 else min(self.min, minimum)
+        self.max = maximum if self.count == 0 else max(self.max, maximum)
+        self.count = total
+
+    def copy(self):
+        return copy.copy(self)
+
+    @property
+    def variance(self):
+        return self.m2 / (self.count - 1) if self.count > 1 else 0.0
+
+
+class FactoryAggregates:
+    """Everything the dashboard serves, maintained incrementally as rows arrive"""
+
+    def __init__(self):
+        self.row_count = 0
+        self.stats = {name: RunningStats() for name in METRIC_COLUMNS}
+        self.daily = None
+        self.machine_types = {}
+        self.latest_state = LatestStateIndex()
+        self.cube = AggregationCube(METRIC_COLUMNS)
+        self.sketches = DailySketches({name: METRIC_COLUMNS[name] for name in SKETCH_METRICS})
+
+    @classmethod
+    def from_frame(cls, df):
+        aggregates = cls()
+        aggregates.update(df)
+        return aggregates
+
+    @property
+    def required_columns(self):
+        """Columns every batch of new rows must have"""
+        columns = ['Date'] + LINE_KEY + [UTILIZATION_COLUMN, AGE_COLUMN] + list(time_series.SERIES_COLUMNS.values())
+        # Drill-down dimensions are fixed by the first load
+        columns += self.cube.dimensions or []
+        # Utilization is also a series column; list each column once
+        return list(dict.fromkeys(columns))
+
+    @property
+    def numeric_columns(self):
+        """Columns that must hold numbers when present"""
+        return list(METRIC_COLUMNS.values()) + [AGE_COLUMN]
+
+    def update(self, df):
+        """Fold new rows into the aggregates; cost depends only on the new rows.
+
+        Every part is updated on a copy and the copies are swapped in at the
+        end, so a failure part way leaves the aggregates as they were.
+        """
+        if df.empty:
+            return
+        stats = {name: running.copy() for name, running in self.stats.items()}
+        for name, column in METRIC_COLUMNS.items():
+            if column in df:
+                stats[name].update(df[column].to_numpy(dtype="float64", na_value=np.nan))
+
+        machine_types = dict(self.machine_types)
+        for machine_type in df['Machine Type'].dropna().unique().tolist():
+            machine_types.setdefault(machine_type, None)
+
+        latest_state = self.latest_state.copy()
+        latest_state.update(df)
+        cube = self.cube.view()
+        cube.update(df)
+        sketches = self.sketches.view()
+        sketches.update(df)
+
+        new_daily = time_series.build_daily_frame(df)
+        if self.daily is None:
+            daily = new_daily
+        elif new_daily.index.min() > self.daily.index.max():
+            # The common streaming case: rows for days we have not seen yet
+            daily = pd.concat([self.daily, new_daily])
+        else:
+            daily = self.daily.add(new_daily, fill_value=0).astype(self.daily.dtypes.to_dict())
+
+        self.row_count += len(df)
+        self.stats = stats
+        self.machine_types = machine_types
+        self.latest_state = latest_state
+        self.cube = cube
+        self.sketches = sketches
+        self.daily = daily
@@ -0,0 +1,129 @@
+import copy
+from itertools import combinations
+
+import pandas as pd
+
+# Drill-down parameter -> CSV column
+DIMENSIONS = {
+    "factory": "Factory",
+    "location": "Location",
+    "machine_type": "Machine Type",
+    "shift": "Shift",
+}
+
+AGGREGATIONS = ["sum", "count", "min", "max"]
+
+# How each stored column combines when cells are merged or rolled up
+_ROLLUP = {"sum": "sum", "count": "sum", "min": "min", "max": "max"}
+
+
+class UnknownFilterValue(ValueError):
+    """A drill-down filter value that does not occur in the data"""
+
+
+def _rollup_spec(columns):
+    return {column: _ROLLUP[column.rsplit("_", 1)[1]] for column in columns}
+
+
+class AggregationCube:
+    """Per-day sum/count/min/max of every metric for every dimension combination.
+
+    One cuboid is materialized per subset of the available dimensions, each
+    indexed by (its dimensions..., Date) and sorted, so any drill-down is a
+    prefix lookup on one cuboid instead of a scan of the raw rows. New rows are
+    aggregated on their own and merged in; the raw rows are never revisited.
+    """
+
+    def __init__(self, metric_columns):
+        self.metric_columns = metric_columns
+        self.dimensions = None
+        self.cuboids = {}
+
+    def update(self, df):
+        if df.empty:
+            return
+        if self.dimensions is None:
+            self.dimensions = [column for column in DIMENSIONS.values() if column in df]
+
+        base = self._aggregate_rows(df)
+        cuboids = {}
+        for size in range(len(self.dimensions) + 1):
+            for subset in combinations(self.dimensions, size):
+                partial = self._rollup(base, list(subset))
+                existing = self.cuboids.get(subset)
+                cuboids[subset] = partial if existing is None else self._merge(existing, partial)
+        # Rebind rather than mutate, so views handed to snapshots never change
+        self.cuboids = cuboids
+
+    def view(self):
+        """Immutable view of the current cuboids for a snapshot"""
+        return copy.copy(self)
+
+    def _aggregate_rows(self, df):
+        metrics = {name: column for name, column in self.metric_columns.items() if column in df}
+        values = df[list(metrics.values())].astype("float64")
+        keys = [df['Date'].dt.normalize().rename('Date')] + [df[column] for column in self.dimensions]
+        grouped = values.groupby(keys, observed=True).agg(AGGREGATIONS)
+        grouped.columns = [f"{name}_{agg}" for name in metrics for agg in AGGREGATIONS]
+        return grouped
+
+    @staticmethod
+    def _rollup(base, subset):
+        levels = subset + ['Date']
+        return base.groupby(level=levels, observed=True).agg(_rollup_spec(base.columns)).sort_index()
+
+    @staticmethod
+    def _merge(existing, partial):
+        combined = pd.concat([existing, partial])
+        if not combined.index.has_duplicates:
+            return combined.sort_index()
+        levels = list(range(combined.index.nlevels))
+        return combined.groupby(level=levels, observed=True).agg(_rollup_spec(combined.columns)).sort_index()
+
+    def values(self, name):
+        """Distinct values of a drill-down parameter, e.g. every factory"""
+        column = DIMENSIONS.get(name)
+        if column not in (self.dimensions or []):
+            return []
+        return self.cuboids[(column,)].index.get_level_values(column).unique().tolist()
+
+    def query(self, filters, start=None, end=None):
+        """Per-day cells matching ``filters`` ({parameter: value}) within [start, end].
+
+        A value that does not occur in the data raises UnknownFilterValue; known
+        values that never occur together give no cells.
+        """
+        unknown = [name for name in filters if DIMENSIONS.get(name) not in (self.dimensions or [])]
+        if unknown:
+            raise ValueError(f"Filtering by {', '.join(unknown)} is not available for this data")
+
+        subset = tuple(column for column in self.dimensions if column in {DIMENSIONS[n] for n in filters})
+        cuboid = self.cuboids[subset]
+        if subset:
+            key = tuple(filters[name] for name, column in DIMENSIONS.items() if column in subset)
+            try:
+                cuboid = cuboid.xs(key, level=list(subset))
+            except KeyError:
+                for name, value in filters.items():
+                    if value not in self.values(name):
+                        raise UnknownFilterValue(f"Unknown {name} {value!r}")
+                cuboid = cuboid.iloc[0:0].droplevel(list(subset))
+
+        start = pd.Timestamp(start) if start is not None else None
+        end = pd.Timestamp(end) if end is not None else None
+        if start is not None or end is not None:
+            cuboid = cuboid.loc[start:end]
+        return cuboid
+
+
+def summarize(cells, metric):
+    """Mean, min, max and count of one metric over a set of cube cells; None without data"""
+    count = int(cells[f"{metric}_count"].sum())
+    if not count:
+        return {"mean": None, "min": None, "max": None, "count": 0}
+    return {
+        "mean": float(cells[f"{metric}_sum"].sum() / count),
+        "min": float(cells[f"{metric}_min"].min()),
+        "max": float(cells[f"{metric}_max"].max()),
+        "count": count,
+    }
@@ -1,149 +1,356 @@
 import pandas as pd
 import datetime
-import random
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, List
+
+from api.models.factory_models import FactoryMetrics, FactoryStatus
+from api.services import aggregates, ingest, line_status, serialization, time_series
+from api.services.cube import AggregationCube, summarize
+from api.services.sketches import DailySketches
+
+
+@dataclass(frozen=True)
+class FactorySnapshot:
+    """Dashboard aggregates computed once from a single version of the data.
+
+    Snapshots are never mutated after they are built; a refresh publishes a
+    new snapshot with a higher version instead, so readers can hand the
+    payloads straight to the response without copying them.
+    """
+    version: int
+    created_at: datetime.datetime
+    daily: pd.DataFrame
+    latest_state: pd.DataFrame
+    cube: AggregationCube
+    sketches: DailySketches
+    metrics: Dict[str, Any]
+    status: List[Dict[str, Any]]
+    machine_types: List[str]
+    batch_quality: Dict[str, float]
+    energy_metrics: Dict[str, float]
+    # The payloads above, validated and serialized once when the snapshot is built
+    encoded: Dict[str, bytes]
+
+
+# /energy-metrics field -> sketched metric
+ENERGY_SKETCHES = {
+    "consumption": "energyConsumption",
+    "efficiency": "energyEfficiency",
+    "emissions": "emissions",
+}
+
+
+def check_percentiles(filters, percentiles):
+    if percentiles and filters:
+        raise ValueError("Percentiles are not available together with drill-down filters")
+    for percentile in percentiles or []:
+        if not 0 <= percentile <= 100:
+            raise ValueError(f"Percentile {percentile:g} is outside 0-100")
+
+
+class DataStoreNotReady(RuntimeError):
+    """Raised when data is requested before the first load has finished"""
+
 
 class DataStore:
-    def __init__(self):
-        self.df = self.load_factory_data()
-        self.last_update = datetime.datetime.now()
-    
-    def load_factory_data(self):
-        """Load factory data from CSV file"""
+    """Factory data and its dashboard aggregates.
+
+    Construction is cheap: nothing is read until load() runs, normally on the
+    background thread started by start_loading(). Until then ``state`` is
+    "loading" (or "failed", with ``error`` set) and ``snapshot`` is None.
+    """
+
+    def __init__(self, operational_threshold=None, warning_threshold=None):
+        self.operational_threshold = (
+            line_status.DEFAULT_OPERATIONAL_THRESHOLD if operational_threshold is None else operational_threshold
+        )
+        self.warning_threshold = (
+            line_status.DEFAULT_WARNING_THRESHOLD if warning_threshold is None else warning_threshold
+        )
+        self._lock = threading.Lock()
+        self._version = 0
+        self._tailer = None
+        self._loader = None
+        self.aggregates = None
+        self.snapshot = None
+        self._listeners = []
+        self.state = "loading"
+        self.error = None
+        self.last_update = None
+
+    @property
+    def ready(self):
+        return self.snapshot is not None
+
+    def require_snapshot(self):
+        """Current snapshot, or DataStoreNotReady while the first load is pending"""
+        snapshot = self.snapshot
+        if snapshot is None:
+            raise DataStoreNotReady(self.error or "Factory data is still loading")
+        return snapshot
+
+    def add_listener(self, callback):
+        """Call ``callback(snapshot)`` every time a new snapshot is published"""
+        self._listeners.append(callback)
+
+    def _publish(self, snapshot):
+        self.snapshot = snapshot
+        for callback in list(self._listeners):
+            try:
+                callback(snapshot)
+            except Exception as e:
+                print(f"Error notifying snapshot listener: {e}")
+
+    def start_loading(self, tail_interval=None):
+        """Load the data on a daemon thread; optionally start tailing once loaded"""
+        if self._loader is not None:
+            return self._loader
+
+        def run():
+            if self.load() is not None and tail_interval:
+                self.start_tailing(tail_interval)
+
+        self._loader = threading.Thread(target=run, name="factory-data-loader", daemon=True)
+        self._loader.start()
+        return self._loader
+
+    def load(self):
+        """Load the data source and publish the first snapshot, recording failures"""
         try:
-            df = pd.read_csv("C:\\Users\\athar\\OneDrive\\Documents\\CascadeProjects\\windsurf-project\\FoamFactory_V2_27K.csv")
-            # Convert Date to datetime
-            df['Date'] = pd.to_datetime(df['Date'])
-            return df
+            return self.refresh()
         except Exception as e:
-            print(f"Error loading CSV data: {e}")
-            return pd.DataFrame()
-        
-    def get_factory_metrics(self):
-        """Get aggregated factory metrics from the DataFrame"""
-        if self.df.empty:
-            return self._initialize_metrics()
-        
-        # Calculate average metrics
-        avg_production = round(self.df['Production Volume (units)'].mean(),2)
-        avg_efficiency = self.df['Machine Utilization (%)'].mean()
-        avg_downtime = self.df['Machine Downtime (hours)'].mean()
-        avg_profit_margin = self.df['Profit Margin (%)'].mean()
-        
-        # Create time series data by date
-        time_series = []
-        for date, group in self.df.groupby(self.df['Date'].dt.date):
-            time_series.append({
-                "name": date.strftime("%Y-%m-%d"),
-                "production": float(group['Production Volume (units)'].mean()),
-                "efficiency": float(group['Machine Utilization (%)'].mean()),
-                "downtime": float(group['Machine Downtime (hours)'].mean())
+            print(f"Error loading factory data from {ingest.FACTORY_CSV_PATH}: {e}")
+            self.error = f"Could not load factory data: {e}"
+            self.state = "failed"
+            return None
+
+    def _reset(self, df):
+        """Replace all state with a freshly loaded frame"""
+        self._chunks = [df]
+        self._df = df
+        self._source_size = df.attrs.get("source_size")
+        self.aggregates = aggregates.FactoryAggregates.from_frame(df)
+        self.last_update = datetime.datetime.now()
+
+    @property
+    def df(self):
+        """All rows loaded so far; appended chunks are only concatenated on demand"""
+        if self._df is None:
+            self._df = pd.concat(self._chunks, ignore_index=True)
+            self._chunks = [self._df]
+        return self._df
+
+    def refresh(self):
+        """Reload the factory data and publish a new snapshot"""
+        df = self.load_factory_data()
+        with self._lock:
+            self._reset(df)
+            if self._tailer is not None:
+                self._tailer = ingest.CsvTailer(self._tailer.csv_path, self._source_size)
+            self._publish(self.build_snapshot())
+            self.state = "ready"
+            self.error = None
+        return self.snapshot
+
+    def append_rows(self, rows):
+        """Ingest new production rows and publish a new snapshot.
+
+        Only the new rows are aggregated: running statistics and daily buckets
+        are updated in place of recomputing over the whole history. Rows that
+        do not match the loaded schema raise ValueError and change nothing.
+        """
+        snapshot = self.require_snapshot()
+        if rows.empty:
+            return snapshot
+        # Validate before taking the lock; rejected rows leave no trace
+        rows = ingest.prepare_rows(rows, self.aggregates.required_columns, self.aggregates.numeric_columns)
+        with self._lock:
+            start = self.aggregates.row_count
+            rows.index = pd.RangeIndex(start, start + len(rows))
+            self.aggregates.update(rows)
+            self._chunks.append(rows)
+            self._df = None
+            self.last_update = datetime.datetime.now()
+            self._publish(self.build_snapshot())
+        return self.snapshot
+
+    def _ensure_tailer(self):
+        if self._tailer is None:
+            self._tailer = ingest.CsvTailer(ingest.FACTORY_CSV_PATH, self._source_size)
+        return self._tailer
+
+    def poll_source(self):
+        """Pick up rows appended to the source CSV since the last poll"""
+        rows = self._ensure_tailer().read_new_rows()
+        if rows is None:
+            print("Source CSV was truncated, reloading it completely")
+            return self.refresh()
+        return self.append_rows(rows)
+
+    def start_tailing(self, interval=5.0):
+        """Poll the source CSV for appended rows from a daemon thread"""
+        self._ensure_tailer()
+
+        def run():
+            while True:
+                time.sleep(interval)
+                try:
+                    self.poll_source()
+                except Exception as e:
+                    print(f"Error tailing CSV data: {e}")
+
+        thread = threading.Thread(target=run, name="factory-csv-tailer", daemon=True)
+        thread.start()
+        return thread
+
+    def build_snapshot(self):
+        """Package the running aggregates into a new immutable snapshot"""
+        self._version += 1
+        daily = self.aggregates.daily
+        payloads = {
+            "metrics": self._compute_factory_metrics(daily),
+            "status": self._compute_factory_status(),
+            "machine_types": self._compute_machine_types(),
+            "batch_quality": self._compute_batch_quality(),
+            "energy_metrics": self._compute_energy_metrics(),
+        }
+        # Validate once here so the routes can serve the encoded bytes as-is
+        FactoryMetrics(**payloads["metrics"])
+        for line in payloads["status"]:
+            FactoryStatus(**line)
+        encoded = {name: serialization.dumps(payload) for name, payload in payloads.items()}
+        encoded["machine_types"] = serialization.dumps({"machine_types": payloads["machine_types"]})
+        return FactorySnapshot(
+            version=self._version,
+            created_at=datetime.datetime.now(),
+            daily=daily,
+            latest_state=self.aggregates.latest_state.frame,
+            cube=self.aggregates.cube.view(),
+            sketches=self.aggregates.sketches.view(),
+            encoded=encoded,
+            **payloads,
+        )
+
+    def load_factory_data(self):
+        """Load factory data, via the columnar cache of the CSV file"""
+        df = ingest.load_factory_frame(ingest.FACTORY_CSV_PATH)
+        if df.empty:
+            raise ValueError(f"{ingest.FACTORY_CSV_PATH} contains no rows")
+        return df
+
+    def get_factory_metrics(self, start=None, end=None, resolution="day", points=None, filters=None, snapshot=None):
+        """Get aggregated factory metrics, optionally for a date window or drill-down.
+
+        Without arguments this is the precomputed snapshot payload. With a
+        window, resolution or point budget the answer is rolled up from the
+        snapshot's per-day sums, so the cost depends on the days requested
+        rather than on the size of the history. Drill-down ``filters``
+        ({"factory": ..., "machine_type": ...}) read the matching cube cells.
+        """
+        snapshot = snapshot or self.require_snapshot()
+        if not filters and start is None and end is None and resolution == "day" and points is None:
+            return snapshot.metrics
+        daily = snapshot.cube.query(filters) if filters else snapshot.daily
+        return time_series.query_metrics(daily, start, end, resolution, points)
+
+    def get_factory_status(self, operational=None, warning=None, snapshot=None):
+        """Get factory status, optionally classified with other utilization thresholds"""
+        snapshot = snapshot or self.require_snapshot()
+        if operational is None and warning is None:
+            return snapshot.status
+        return line_status.line_status(
+            snapshot.latest_state,
+            self.operational_threshold if operational is None else operational,
+            self.warning_threshold if warning is None else warning,
+        )
+
+    def get_machine_types(self):
+        """Get unique machine types from the current snapshot"""
+        return self.require_snapshot().machine_types
+
+    def get_batch_quality(self, filters=None, start=None, end=None, percentiles=None, snapshot=None):
+        """Get batch quality metrics, optionally for a drill-down, date window and percentiles.
+
+        Percentiles come from the per-day quantile sketches, which are only
+        kept for the whole factory, so they cannot be combined with ``filters``.
+        """
+        snapshot = snapshot or self.require_snapshot()
+        check_percentiles(filters, percentiles)
+        if not filters and start is None and end is None:
+            batch_quality = snapshot.batch_quality
+        else:
+            quality = summarize(snapshot.cube.query(filters or {}, start, end), 'quality')
+            batch_quality = {"average": quality["mean"], "min": quality["min"], "max": quality["max"]}
+        if percentiles:
+            batch_quality = dict(batch_quality, percentiles=snapshot.sketches.percentiles('quality', percentiles, start, end))
+        return batch_quality
+
+    def get_energy_metrics(self, filters=None, start=None, end=None, percentiles=None, snapshot=None):
+        """Get energy consumption and efficiency metrics, optionally for a drill-down, date window and percentiles"""
+        snapshot = snapshot or self.require_snapshot()
+        check_percentiles(filters, percentiles)
+        if not filters and start is None and end is None:
+            energy_metrics = snapshot.energy_metrics
+        else:
+            cells = snapshot.cube.query(filters or {}, start, end)
+            energy_metrics = {
+                "consumption": summarize(cells, 'energyConsumption')["mean"],
+                "efficiency": summarize(cells, 'energyEfficiency')["mean"],
+                "emissions": summarize(cells, 'emissions')["mean"],
+            }
+        if percentiles:
+            energy_metrics = dict(energy_metrics, percentiles={
+                field: snapshot.sketches.percentiles(metric, percentiles, start, end)
+                for field, metric in ENERGY_SKETCHES.items()
             })
+        return energy_metrics
+
+    def _compute_factory_metrics(self, daily):
+        """Get aggregated factory metrics from the running aggregates"""
+        stats = self.aggregates.stats
         
-        # Sort time series by date
-        time_series = sorted(time_series, key=lambda x: x["name"])
+        # Calculate average metrics
+        avg_production = round(stats['production'].mean, 2)
+        avg_efficiency = stats['efficiency'].mean
+        avg_downtime = stats['downtime'].mean
+        avg_profit_margin = stats['profitMargin'].mean
         
         return {
             "production": float(avg_production),
             "efficiency": float(avg_efficiency),
             "downtime": float(avg_downtime),
             "profitMargin": float(avg_profit_margin),
-            "timeSeriesData": time_series
+            "timeSeriesData": time_series.to_time_series(daily)
         }
     
-    def get_factory_status(self):
-        """Get factory status from the DataFrame"""
-        if self.df.empty:
-            return self._initialize_status()
-        
-        # Get the latest data for each machine type
-        latest_date = self.df['Date'].max()
-        latest_data = self.df[self.df['Date'] == latest_date]
-        
-        status_list = []
-        for i, row in latest_data.iterrows():
-            # Determine status based on machine utilization
-            if row['Machine Utilization (%)'] >= 55:
-                status = "operational"
-            elif row['Machine Utilization (%)'] >= 50:
-                status = "warning"
-            else:
-                status = "down"
-                
-            status_list.append({
-                "id": f"line-{i}",
-                "name": f"{row['Machine Type']} - {row['Batch']}",
-                "status": status,
-                "efficiency": f"{row['Machine Utilization (%)']}%",
-                "lastMaintenance": f"{row['Machine Age (years)']:.1f} years"
-            })
-            
-        return status_list
+    def _compute_factory_status(self):
+        """Get the latest status of every production line"""
+        return line_status.line_status(self.aggregates.latest_state.frame, self.operational_threshold, self.warning_threshold)
     
-    def _initialize_metrics(self):
-        """Fallback method if data is not available"""
-        time_series = [
-            {
-                "name": f"Day {i}",
-                "production": round(random.uniform(1500, 4500), 2),
-                "efficiency": round(random.uniform(65, 95), 2),
-                "downtime": round(random.uniform(0.5, 5), 2)
-            }
-            for i in range(1, 31, 5)
-        ]
-        
-        return {
-            "production": round(random.uniform(1000, 1500), 2),
-            "efficiency": round(random.uniform(85, 95), 2),
-            "downtime": round(random.uniform(2, 4), 2),
-            "profitMargin": round(random.uniform(20, 30), 2),
-            "timeSeriesData": time_series
-        }
+    def _compute_machine_types(self):
+        """Get unique machine types seen so far"""
+        return list(self.aggregates.machine_types)
     
-    def _initialize_status(self):
-        """Fallback method if data is not available"""
-        statuses = ["operational", "warning", "down"]
-        weights = [0.7, 0.2, 0.1]  # Probability weights for each status
-        
-        return [
-            {
-                "id": f"line-{i}",
-                "name": f"Production Line {i}",
-                "status": random.choices(statuses, weights=weights)[0],
-                "efficiency": f"{random.randint(60, 98)}%" if i != 4 else "0%",
-                "lastMaintenance": f"{random.randint(1, 14)} days ago"
-            }
-            for i in range(1, 6)
-        ]
-
-    def get_machine_types(self):
-        """Get unique machine types from the DataFrame"""
-        if self.df.empty:
-            return ["Type 1", "Type 2", "Type 3"]
-        
-        return self.df['Machine Type'].unique().tolist()
-    
-    def get_batch_quality(self):
+    def _compute_batch_quality(self):
         """Get batch quality metrics"""
-        if self.df.empty:
-            return {"average": 85, "min": 80, "max": 95}
-        
+        quality = self.aggregates.stats['quality']
         return {
-            "average": float(self.df['Batch Quality (Pass %)'].mean()),
-            "min": float(self.df['Batch Quality (Pass %)'].min()),
-            "max": float(self.df['Batch Quality (Pass %)'].max())
+            "average": float(quality.mean),
+            "min": float(quality.min),
+            "max": float(quality.max)
         }
     
-    def get_energy_metrics(self):
+    def _compute_energy_metrics(self):
         """Get energy consumption and efficiency metrics"""
-        if self.df.empty:
-            return {"consumption": 800, "efficiency": 1.5, "emissions": 800}
-        
+        stats = self.aggregates.stats
         return {
-            "consumption": float(self.df['Energy Consumption (kWh)'].mean()),
-            "efficiency": float(self.df['Energy Efficiency Rating'].mean()),
-            "emissions": float(self.df['CO2 Emissions (kg)'].mean())
+            "consumption": float(stats['energyConsumption'].mean),
+            "efficiency": float(stats['energyEfficiency'].mean),
+            "emissions": float(stats['emissions'].mean)
         }
 
-# Create a singleton instance
+# Create a singleton instance; the data itself is loaded by start_loading()
 data_store = DataStore()
 
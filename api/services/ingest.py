@@ -0,0 +1,245 @@
+import io
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pragma: no cover - pyarrow is optional
+    pa = None
+    pq = None
+
+FACTORY_CSV_PATH = os.getenv(
+    "FACTORY_DATA_PATH",
+    "C:\\Users\\athar\\OneDrive\\Documents\\CascadeProjects\\windsurf-project\\FoamFactory_V2_27K.csv",
+)
+
+# Parquet schema metadata key holding the fingerprint of the CSV a cache was built from
+FINGERPRINT_KEY = b"factory_ui.source_fingerprint"
+
+# String columns with fewer distinct values than this share of rows become categoricals
+CATEGORY_RATIO = 0.5
+
+
+def cache_path_for(csv_path):
+    """Columnar cache file kept next to the source CSV"""
+    return os.path.splitext(csv_path)[0] + ".parquet"
+
+
+def source_fingerprint(csv_path):
+    """Cheap change detector for the source CSV (size + mtime)"""
+    stat = os.stat(csv_path)
+    return f"{stat.st_size}:{stat.st_mtime_ns}"
+
+
+def _fingerprint_size(fingerprint):
+    return int(fingerprint.split(":", 1)[0])
+
+
+def _float32_is_exact(values):
+    """True when every value survives a float32 round trip unchanged"""
+    values = values.dropna().to_numpy(dtype="float64")
+    return bool(np.array_equal(values.astype("float32").astype("float64"), values))
+
+
+def narrow_dtypes(df):
+    """Shrink a freshly parsed frame: categoricals for repeated strings, smallest numeric types.
+
+    Float columns are only narrowed when float32 represents them exactly;
+    decimal readings such as 88.93 would otherwise surface as 88.93000030517578
+    in the dashboard and shift the reported averages.
+    """
+    for column in df.columns:
+        series = df[column]
+        if column == 'Date':
+            continue
+        if series.dtype == object or pd.api.types.is_string_dtype(series.dtype):
+            if series.nunique(dropna=True) < CATEGORY_RATIO * max(len(series), 1):
+                df[column] = series.astype("category")
+        elif pd.api.types.is_integer_dtype(series.dtype):
+            df[column] = pd.to_numeric(series, downcast="integer")
+        elif pd.api.types.is_float_dtype(series.dtype) and _float32_is_exact(series):
+            df[column] = series.astype("float32")
+    return df
+
+
+def read_factory_csv(csv_path):
+    """Parse the raw CSV the slow way: text parsing plus date conversion"""
+    df = pd.read_csv(csv_path)
+    df['Date'] = pd.to_datetime(df['Date'])
+    return df
+
+
+def build_columnar_cache(csv_path, cache_path=None):
+    """Convert the CSV into a Parquet file with narrowed dtypes.
+
+    The cache is written to a temporary file and moved into place, so
+    concurrently starting workers never read a half-written file. If it
+    cannot be written (e.g. a read-only data directory) the parsed frame is
+    still returned.
+    """
+    cache_path = cache_path or cache_path_for(csv_path)
+    fingerprint = source_fingerprint(csv_path)
+    df = narrow_dtypes(read_factory_csv(csv_path))
+
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    metadata = dict(table.schema.metadata or {})
+    metadata[FINGERPRINT_KEY] = fingerprint.encode()
+    table = table.replace_schema_metadata(metadata)
+
+    tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+    try:
+        pq.write_table(table, tmp_path)
+        os.replace(tmp_path, cache_path)
+        print(f"Built columnar cache {cache_path} from {csv_path}")
+    except OSError as e:
+        print(f"Could not write columnar cache {cache_path}, using the parsed CSV: {e}")
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+    df.attrs["source_size"] = _fingerprint_size(fingerprint)
+    return df
+
+
+def is_cache_fresh(csv_path, cache_path):
+    """Whether the cache exists and was built from the current CSV"""
+    if not os.path.exists(cache_path):
+        return False
+    try:
+        metadata = pq.read_schema(cache_path).metadata or {}
+    except Exception:
+        return False
+    return metadata.get(FINGERPRINT_KEY) == source_fingerprint(csv_path).encode()
+
+
+def load_factory_frame(csv_path, cache_path=None):
+    """Load the factory data, going through the columnar cache when possible.
+
+    The cache is rebuilt automatically whenever the source CSV changes. Without
+    pyarrow the CSV is parsed directly but still gets the narrowed dtypes.
+    ``df.attrs["source_size"]`` records how many bytes of the CSV the frame
+    covers, which is where a CsvTailer should start reading.
+    """
+    if pq is None:
+        source_size = os.path.getsize(csv_path)
+        df = narrow_dtypes(read_factory_csv(csv_path))
+        df.attrs["source_size"] = source_size
+        return df
+
+    cache_path = cache_path or cache_path_for(csv_path)
+    if not is_cache_fresh(csv_path, cache_path):
+        return build_columnar_cache(csv_path, cache_path)
+    # self_destruct frees each Arrow column as soon as it has been converted,
+    # so the load does not briefly hold both copies of the data.
+    table = pq.read_table(cache_path)
+    fingerprint = table.schema.metadata[FINGERPRINT_KEY].decode()
+    df = table.to_pandas(self_destruct=True, split_blocks=True)
+    del table
+    pa.default_memory_pool().release_unused()
+    df.attrs["source_size"] = _fingerprint_size(fingerprint)
+    return df
+
+
+def prepare_rows(df, required=(), numeric=()):
+    """Coerce freshly received rows (CSV tail or POST body) to the loaded schema.
+
+    Raises ValueError when a ``required`` column is missing, a date does not
+    parse or a ``numeric`` column holds something other than numbers.
+    """
+    missing = [column for column in required if column not in df]
+    if missing:
+        raise ValueError(f"Rows are missing the columns {', '.join(missing)}")
+    df = df.copy()
+    df['Date'] = pd.to_datetime(df['Date'])
+    if df['Date'].isna().any():
+        raise ValueError("Every row needs a 'Date'")
+    for column in df.columns:
+        if column != 'Date' and df[column].dtype == object:
+            converted = pd.to_numeric(df[column], errors="coerce")
+            if converted.notna().sum() == df[column].notna().sum():
+                df[column] = converted
+    invalid = [
+        column for column in numeric
+        if column in df and not (pd.api.types.is_numeric_dtype(df[column]) or df[column].isna().all())
+    ]
+    if invalid:
+        raise ValueError(f"Columns {', '.join(invalid)} must be numeric")
+    return df
+
+
+class CsvTailer:
+    """Reads rows appended to the source CSV since the last call.
+
+    Only complete lines are consumed; a partially written last line is left
+    for the next poll. If the file shrinks (rotated or rewritten) the tailer
+    reports it so the caller can fall back to a full reload.
+    """
+
+    def __init__(self, csv_path, offset=None):
+        self.csv_path = csv_path
+        with open(csv_path, "rb") as f:
+            self.header = f.readline()
+        self.offset = os.path.getsize(csv_path) if offset is None else offset
+
+    def read_new_rows(self):
+        """Return a DataFrame of newly appended rows, or None if the file was truncated"""
+        size = os.path.getsize(self.csv_path)
+        if size < self.offset:
+            return None
+        if size == self.offset:
+            return pd.DataFrame()
+
+        with open(self.csv_path, "rb") as f:
+            f.seek(self.offset)
+            chunk = f.read(size - self.offset)
+        end = chunk.rfind(b"\n")
+        if end < 0:
+            return pd.DataFrame()
+        self.offset += end + 1
+        return prepare_rows(pd.read_csv(io.BytesIO(self.header + chunk[:end + 1])))
+
+
+def _resident_mb():
+    """Current resident set size of this process (Linux), in MB"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1024 / 1024
+    except (OSError, ValueError):
+        return float("nan")
+
+
+def _measure(mode, csv_path):
+    """Load once in this process and report wall time and resident memory growth"""
+    rss_before = _resident_mb()
+    started = time.perf_counter()
+    if mode == "csv":
+        df = read_factory_csv(csv_path)
+    else:
+        df = load_factory_frame(csv_path)
+    elapsed = time.perf_counter() - started
+    rss_after = _resident_mb()
+    frame_mb = df.memory_usage(deep=True).sum() / 1024 / 1024
+    print(
+        f"{mode:>8}: load {elapsed * 1000:8.1f} ms | frame {frame_mb:7.2f} MB | "
+        f"RSS {rss_after:7.1f} MB (+{rss_after - rss_before:.1f} MB for the load)"
+    )
+
+
+if __name__ == "__main__":
+    # Cold start comparison, each mode in a fresh interpreter:
+    #   python -m api.services.ingest [path/to/FoamFactory.csv]
+    import subprocess
+    import sys
+
+    if len(sys.argv) == 3 and sys.argv[1] in ("csv", "columnar"):
+        _measure(sys.argv[1], sys.argv[2])
+        sys.exit(0)
+
+    csv_path = sys.argv[1] if len(sys.argv) > 1 else FACTORY_CSV_PATH
+    build_columnar_cache(csv_path)
+    for mode in ("csv", "columnar"):
+        subprocess.run([sys.executable, "-m", "api.services.ingest", mode, csv_path], check=True)
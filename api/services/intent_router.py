@@ -0,0 +1,331 @@
+import os
+import re
+
+import pandas as pd
+
+from api.services import time_series
+from api.services.data_store import DataStoreNotReady, data_store
+
+# Answer simple KPI questions from the dashboard aggregates instead of the
+# LLM + Neo4j chain; questions below BOT_ROUTER_THRESHOLD confidence go to
+# the chain.
+BOT_ROUTER = os.getenv("BOT_ROUTER", "1").lower() in ("1", "true", "yes", "on")
+BOT_ROUTER_THRESHOLD = float(os.getenv("BOT_ROUTER_THRESHOLD", "0.7"))
+
+# Intent -> {phrase: weight}. Phrases are matched longest first and a
+# matched span is not matched again, so "energy efficiency" counts for
+# energy only.
+INTENTS = {
+    "production": {"production": 1.0, "produced": 1.0, "produce": 0.8, "output": 0.8, "units": 0.6, "volume": 0.6},
+    "efficiency": {"efficiency": 1.0, "utilization": 1.0, "utilisation": 1.0, "performance": 0.6},
+    "downtime": {"downtime": 1.0, "down time": 1.0, "stoppage": 0.8, "maintenance": 0.6, "repair": 0.6},
+    "profit": {"profit margin": 1.2, "profit": 1.0, "profitability": 1.0, "margin": 0.8},
+    "status": {"status": 1.0, "line status": 1.2, "operational": 0.8, "condition": 0.6, "state": 0.5, "lines": 0.5},
+    "quality": {"batch quality": 1.2, "quality": 1.0, "pass rate": 1.0, "defects": 0.6},
+    "energy": {
+        "energy efficiency": 1.2, "energy": 1.0, "consumption": 0.8, "kwh": 1.0,
+        "emissions": 1.0, "co2": 1.0, "carbon": 0.8, "power": 0.6,
+    },
+    "machine_types": {"machine types": 1.2, "types of machines": 1.2, "kinds of machines": 1.2},
+    "help": {"help": 1.0, "what can you": 1.0, "commands": 0.8},
+}
+
+# Markers of questions that need reasoning, ranking or data the aggregates
+# do not have; each one lowers the confidence of a local answer.
+OPEN_ENDED = {
+    "why": 1.5, "how come": 1.5, "explain": 1.0, "reason": 1.0, "cause": 1.0,
+    "compare": 1.0, "versus": 1.0, "vs": 1.0, "correlation": 1.0, "relationship": 1.0,
+    "predict": 1.0, "forecast": 1.0, "recommend": 1.0, "should": 0.8, "improve": 0.8,
+    "which": 0.6, "best": 0.8, "worst": 0.8, "highest": 0.8, "lowest": 0.8,
+    "most": 0.8, "least": 0.8, "affect": 1.0, "impact": 1.0,
+    "influence": 1.0, "factors": 1.0, "operator": 1.0, "operators": 1.0,
+    "supplier": 1.0, "suppliers": 1.0,
+}
+
+# References the aggregates cannot resolve (a single batch, machine or line,
+# or a factory, location or machine type that is not in the data; known
+# ones are blanked out before this is checked)
+UNRESOLVED = re.compile(
+    r"\b(?:batch|machine|line)\s*#?\s*\d+\b|\b(?:factory|location)\s+(?:\d+|[a-z])\b|\btype\s+\d+\b"
+)
+
+# Breakdowns, totals, extremes, counts, trends and dimensions the aggregates
+# do not have; a local answer would be a single average for all of them, so
+# these questions always go to the chain
+CHAIN_ONLY = re.compile(
+    r"\b(?:per|each|every|by|total|sum|max|maximum|min|minimum|top|bottom|high|low|"
+    r"trends?|over\s+time|changes?|changed|daily|weekly|monthly|quarterly|yearly|annual(?:ly)?|"
+    r"how\s+many|count|number\s+of|list|breakdown|distribution|rank(?:ing)?|"
+    r"teams?|shifts?|suppliers?|raw\s+materials?)\b"
+)
+
+# Drill-down parameters recognised by name in questions; shift values
+# ("Day", "Night") are too common as plain words to match safely.
+ENTITY_DIMENSIONS = ["factory", "location", "machine_type"]
+
+MONTHS = ["january", "february", "march", "april", "may", "june", "july",
+          "august", "september", "october", "november", "december"]
+ISO_DATE = re.compile(r"\b(\d{4}-\d{2}-\d{2})\b")
+LAST_PERIOD = re.compile(r"\b(?:last|past|previous)\s+(\d+\s+)?(day|week|month|year)s?\b")
+# "may" is only a month with a preposition before it or a year after it
+MONTH = re.compile(
+    r"\b(?:(?:in|during|for|of)\s+)?(" + "|".join(MONTHS) + r")\b(?:\s+(\d{4}))?"
+)
+YEAR = re.compile(r"\b((?:19|20)\d{2})\b")
+PERIOD_DAYS = {"day": 1, "week": 7}
+
+
+def _phrase_pattern(phrase):
+    return re.compile(r"\b" + r"\s+".join(re.escape(word) for word in phrase.split()) + r"\b")
+
+
+_PHRASES = sorted(
+    [(intent, phrase, weight, _phrase_pattern(phrase)) for intent, phrases in INTENTS.items() for phrase, weight in phrases.items()]
+    + [(None, phrase, weight, _phrase_pattern(phrase)) for phrase, weight in OPEN_ENDED.items()],
+    key=lambda item: len(item[1]),
+    reverse=True,
+)
+
+# Entity patterns are compiled once per data snapshot
+_vocabulary = (None, None)
+
+
+def _entity_patterns(snapshot):
+    global _vocabulary
+    version, patterns = _vocabulary
+    if version != snapshot.version:
+        patterns = [
+            (name, value, _phrase_pattern(str(value).lower()))
+            for name in ENTITY_DIMENSIONS
+            for value in sorted(snapshot.cube.values(name), key=lambda value: len(str(value)), reverse=True)
+        ]
+        _vocabulary = (snapshot.version, patterns)
+    return patterns
+
+
+def _blank(text, match):
+    return text[:match.start()] + " " * (match.end() - match.start()) + text[match.end():]
+
+
+def extract_entities(text, snapshot):
+    """Drill-down filters and date window named in a lower-cased question.
+
+    Returns (filters, start, end, text) where ``text`` has the matched
+    entities blanked out. Relative dates ("last week", "yesterday") count
+    back from the newest day in the data; "last month" and "last year" are
+    the calendar month or year before the one that day falls in. Dates
+    that do not exist or are out of range raise ValueError or OverflowError.
+    """
+    filters = {}
+    for name, value, pattern in _entity_patterns(snapshot):
+        match = pattern.search(text)
+        if match and name not in filters:
+            filters[name] = value
+            text = _blank(text, match)
+
+    start = end = None
+    latest = snapshot.daily.index.max() if not snapshot.daily.empty else pd.Timestamp.now().normalize()
+    dates = ISO_DATE.findall(text)
+    if dates:
+        days = sorted(pd.Timestamp(day) for day in dates[:2])
+        start, end = days[0], days[-1]
+        text = ISO_DATE.sub(" ", text)
+    elif re.search(r"\btoday\b", text):
+        start = end = latest
+    elif re.search(r"\byesterday\b", text):
+        start = end = latest - pd.Timedelta(days=1)
+    elif re.search(r"\bthis\s+month\b", text):
+        start, end = latest.replace(day=1), latest
+    elif re.search(r"\bthis\s+year\b", text):
+        start, end = latest.replace(month=1, day=1), latest
+    else:
+        match = LAST_PERIOD.search(text)
+        if match:
+            count, unit = int(match.group(1) or 1), match.group(2)
+            if unit in PERIOD_DAYS:
+                start, end = latest - pd.Timedelta(days=count * PERIOD_DAYS[unit] - 1), latest
+            else:
+                current = latest.replace(day=1) if unit == "month" else latest.replace(month=1, day=1)
+                start = current - (pd.DateOffset(months=count) if unit == "month" else pd.DateOffset(years=count))
+                end = current - pd.Timedelta(days=1)
+        else:
+            for match in MONTH.finditer(text):
+                month, year = match.group(1), match.group(2)
+                if month == "may" and not year and match.group(0) == month:
+                    continue
+                month_number = MONTHS.index(month) + 1
+                if year:
+                    year = int(year)
+                else:
+                    # The most recent such month in the data
+                    year = latest.year if month_number <= latest.month else latest.year - 1
+                start = pd.Timestamp(year=year, month=month_number, day=1)
+                end = start + pd.offsets.MonthEnd(0)
+                text = _blank(text, match)
+                break
+            else:
+                match = YEAR.search(text)
+                if match:
+                    start = pd.Timestamp(year=int(match.group(1)), month=1, day=1)
+                    end = pd.Timestamp(year=int(match.group(1)), month=12, day=31)
+                    text = _blank(text, match)
+    return filters, start, end, text
+
+
+def classify(message, snapshot):
+    """Intent, confidence (0-1) and entities of a bot question.
+
+    Confidence is the winning intent's score over the total of the
+    runner-up, the open-ended markers and the winner itself, so mixed or
+    open-ended questions score low.
+    """
+    text = " ".join(message.lower().replace("'", " ").split())
+    filters, start, end, text = extract_entities(text, snapshot)
+    result = {"intent": None, "confidence": 0.0, "filters": filters, "start": start, "end": end}
+    if UNRESOLVED.search(text) or CHAIN_ONLY.search(text):
+        return result
+
+    scores = dict.fromkeys(INTENTS, 0.0)
+    open_ended = 0.0
+    for intent, _, weight, pattern in _PHRASES:
+        for match in list(pattern.finditer(text)):
+            if intent is None:
+                open_ended += weight
+            else:
+                scores[intent] += weight
+            text = _blank(text, match)
+
+    ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+    (intent, top), (_, runner_up) = ranked[0], ranked[1]
+    if top:
+        result["intent"] = intent
+        result["confidence"] = top / (top + runner_up + open_ended)
+    return result
+
+
+def _scope(filters, start, end):
+    parts = [str(value) for value in filters.values()]
+    if start is not None:
+        parts.append(f"{start:%Y-%m-%d}" if start == end else f"{start:%Y-%m-%d} to {end:%Y-%m-%d}")
+    return f" ({', '.join(parts)})" if parts else ""
+
+
+def _metrics(snapshot, filters, start, end):
+    """Production/efficiency/downtime/profit averages and the rows behind them"""
+    if not filters and start is None and end is None:
+        return snapshot.metrics, True
+    daily = snapshot.cube.query(filters) if filters else snapshot.daily
+    window = time_series.slice_range(daily, start, end)
+    return time_series.window_averages(window), bool(window["production_count"].sum())
+
+
+def _answer(intent, snapshot, filters, start, end):
+    """Reply text for a classified question, or None if it needs the graph chain"""
+    scope = _scope(filters, start, end)
+    if intent == "help":
+        return ("I can provide information about production rates, efficiency, downtime, profit margins, "
+                "line status, batch quality, energy consumption and machine types, for the whole plant or a "
+                "factory, location or machine type and a period such as 'last week' or 'March 2024'. "
+                "Anything else is looked up in the factory knowledge graph.")
+    if intent == "machine_types":
+        return f"The machine types in use are {', '.join(map(str, snapshot.machine_types))}."
+    if intent == "status":
+        # Line status is the latest state per machine type and batch only
+        if set(filters) - {"machine_type"} or start is not None:
+            return None
+        lines = data_store.get_factory_status(snapshot=snapshot)
+        if filters:
+            prefix = f"{filters['machine_type']} - "
+            lines = [line for line in lines if line["name"].startswith(prefix)]
+        counts = {state: sum(1 for line in lines if line["status"] == state) for state in ("operational", "warning", "down")}
+        return (f"Currently{scope}, {counts['operational']} production lines are operational, "
+                f"{counts['warning']} showing warnings and {counts['down']} down "
+                f"(operational means at least {data_store.operational_threshold:g}% utilization).")
+    if intent in ("production", "efficiency", "downtime", "profit"):
+        metrics, has_data = _metrics(snapshot, filters, start, end)
+        if not has_data:
+            return f"There is no production data{scope}."
+        if intent == "production":
+            return (f"Average production{scope} is {metrics['production']:.2f} units per batch, "
+                    f"at {metrics['efficiency']:.2f}% machine utilization.")
+        if intent == "efficiency":
+            return (f"Machine utilization{scope} averages {metrics['efficiency']:.2f}%, "
+                    f"with a profit margin of {metrics['profitMargin']:.2f}%.")
+        if intent == "downtime":
+            return f"Machine downtime{scope} averages {metrics['downtime']:.2f} hours per batch."
+        return f"The profit margin{scope} averages {metrics['profitMargin']:.2f}%."
+    if intent == "quality":
+        quality = data_store.get_batch_quality(filters, start, end, snapshot=snapshot)
+        if not quality["average"] and not quality["max"]:
+            return f"There is no batch quality data{scope}."
+        return (f"The average batch quality pass rate{scope} is {quality['average']:.2f}%, "
+                f"ranging from {quality['min']:.2f}% to {quality['max']:.2f}%.")
+    if intent == "energy":
+        energy = data_store.get_energy_metrics(filters, start, end, snapshot=snapshot)
+        if not energy["consumption"]:
+            return f"There is no energy data{scope}."
+        return (f"Average energy consumption{scope} is {energy['consumption']:.2f} kWh with an "
+                f"efficiency rating of {energy['efficiency']:.2f}; CO2 emissions average {energy['emissions']:.2f} kg.")
+    return None
+
+
+def route(message, threshold=None):
+    """Answer ``message`` from the dashboard aggregates when that is safe.
+
+    Returns a result shaped like the graph chain's ({"query", "result",
+    "intent", "confidence"}) or None when the question should go to the
+    chain: the router is disabled, the data is still loading, or the
+    question is open-ended, ambiguous or about something not aggregated.
+    """
+    if not BOT_ROUTER:
+        return None
+    try:
+        snapshot = data_store.require_snapshot()
+    except DataStoreNotReady:
+        return None
+    # Any parse failure (an impossible date, a period out of range) hands the
+    # question to the chain rather than failing the request
+    try:
+        classified = classify(message, snapshot)
+        if classified["intent"] is None or classified["confidence"] < (BOT_ROUTER_THRESHOLD if threshold is None else threshold):
+            return None
+        reply = _answer(classified["intent"], snapshot, classified["filters"], classified["start"], classified["end"])
+    except (ValueError, OverflowError) as e:
+        print(f"Intent router could not answer locally: {e}")
+        return None
+    if reply is None:
+        return None
+    return {
+        "query": message,
+        "result": reply,
+        "intent": classified["intent"],
+        "confidence": round(classified["confidence"], 3),
+    }
+
+
+def _benchmark(questions=None, repeat=200):
+    """Routing decision and time per question against the loaded data"""
+    import time
+
+    data_store.load()
+    questions = questions or [
+        "What's our current production?",
+        "How's our efficiency in Factory 1 last week?",
+        "Energy consumption for Type 1 machines in March 2020",
+        "What's the status of our lines?",
+        "Why did downtime increase in Factory 2?",
+        "Which factory has the highest production?",
+        "What maintenance did machine 12 get?",
+    ]
+    for question in questions:
+        started = time.perf_counter()
+        for _ in range(repeat):
+            result = route(question)
+        elapsed = (time.perf_counter() - started) / repeat
+        decision = f"{result['intent']} ({result['confidence']:.2f})" if result else "graph chain"
+        print(f"{elapsed * 1e6:8.1f} us  {decision:<22} {question}")
+
+
+if __name__ == "__main__":
+    #   FACTORY_DATA_PATH=... python -m api.services.intent_router
+    _benchmark()
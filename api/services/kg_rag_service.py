@@ -1,12 +1,165 @@
 import asyncio
-from api.kg_rag import kg_rag
+import contextvars
+import os
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from uuid import uuid4
+
+from api.services import intent_router
+
+# api.kg_rag.kg_rag pulls in langchain, the OpenAI client and the Neo4j
+# driver, which takes seconds; it is only imported when the graph is first
+# needed so importing the API stays fast.
+KG_RAG_MODULE = "api.kg_rag.kg_rag"
+
+def _kg_rag():
+    from api.kg_rag import kg_rag
+    return kg_rag
+
+def _loaded_assistant():
+    """The assistant if the knowledge graph stack was already initialized"""
+    kg_rag = sys.modules.get(KG_RAG_MODULE)
+    return kg_rag.assistant if kg_rag is not None else None
 
 async def init_graph():
-    await kg_rag.init_graph()
+    await _kg_rag().init_graph()
 
 def initialize_graph():
     asyncio.run(init_graph())
 
-def get_bot_response(message: str) -> str:
-    return kg_rag.get_kg_answer(message)
+def new_session_id() -> str:
+    """Session id for a client that did not send one.
+
+    Pass ``new_session=True`` along with it so its (empty) history is not
+    looked up in Neo4j.
+    """
+    return f"factory_session_{uuid4()}"
+
+def get_graph_answer(message: str, session_id: str = None, new_session: bool = False):
+    """Answer from the LLM + knowledge graph chain"""
+    return _kg_rag().get_kg_answer(message, session_id, new_session)
+
+def answer_locally(message: str):
+    """The intent router's answer from the dashboard data, or None for the graph chain"""
+    return intent_router.route(message)
+
+def get_bot_response(message: str, session_id: str = None, new_session: bool = False) -> str:
+    return answer_locally(message) or get_graph_answer(message, session_id, new_session)
+
+# Bot questions are synchronous LLM + Neo4j round trips of several seconds.
+# They run on this dedicated pool, never on the event loop, and at most
+# BOT_MAX_CONCURRENCY at once; a question that cannot start within
+# BOT_QUEUE_TIMEOUT seconds is rejected with BotBusy.
+BOT_MAX_CONCURRENCY = int(os.getenv("BOT_MAX_CONCURRENCY", "4"))
+BOT_QUEUE_TIMEOUT = float(os.getenv("BOT_QUEUE_TIMEOUT", "30"))
+
+_executor = ThreadPoolExecutor(max_workers=BOT_MAX_CONCURRENCY, thread_name_prefix="bot")
+_slots = None
+
+class BotBusy(RuntimeError):
+    """Raised when every bot worker stayed busy for the whole queue timeout"""
+
+async def acquire_bot_slot():
+    """Wait for a free bot worker; BotBusy after BOT_QUEUE_TIMEOUT seconds"""
+    global _slots
+    if _slots is None:
+        _slots = asyncio.Semaphore(BOT_MAX_CONCURRENCY)
+    try:
+        await asyncio.wait_for(_slots.acquire(), BOT_QUEUE_TIMEOUT)
+    except asyncio.TimeoutError:
+        raise BotBusy(f"All {BOT_MAX_CONCURRENCY} bot workers are busy, try again shortly")
+
+def release_bot_slot():
+    _slots.release()
+
+def _submit_holding_slot(fn, *args):
+    """Run ``fn`` on the bot pool for a caller that holds a slot.
+
+    The slot then belongs to the worker and is released when it finishes,
+    not when the caller stops waiting: a cancelled or abandoned caller must
+    not free a slot while its question is still running.
+    """
+    loop = asyncio.get_running_loop()
+    try:
+        worker = _executor.submit(contextvars.copy_context().run, fn, *args)
+    except BaseException:
+        release_bot_slot()
+        raise
+    worker.add_done_callback(lambda _: loop.call_soon_threadsafe(release_bot_slot))
+    return worker
+
+async def run_bot_task(fn, *args):
+    """Run a blocking bot call on the bot pool, keeping the caller's contextvars"""
+    await acquire_bot_slot()
+    return await asyncio.wrap_future(_submit_holding_slot(fn, *args))
+
+async def get_bot_response_async(message: str, session_id: str = None, new_session: bool = False):
+    """get_bot_response without blocking the event loop.
+
+    Questions the intent router answers from the dashboard aggregates take
+    well under a millisecond and never wait for a bot worker.
+    """
+    local = answer_locally(message)
+    if local is not None:
+        return local
+    return await run_bot_task(get_graph_answer, message, session_id, new_session)
+
+async def start_bot_stream(message: str, session_id: str = None, new_session: bool = False):
+    """Start streaming an answer on the bot pool; BotBusy if no worker frees up.
+
+    Returns an async iterator of (event, data) from stream_kg_answer. The
+    worker starts right away and releases its slot when it finishes, even
+    if the iterator is never consumed. If the consumer goes away early the
+    worker stops at the next token instead of finishing the answer.
+    """
+    await acquire_bot_slot()
+    loop = asyncio.get_running_loop()
+    events = asyncio.Queue()
+    cancelled = threading.Event()
+    done = object()
+
+    def produce():
+        try:
+            for item in _kg_rag().stream_kg_answer(message, session_id, new_session):
+                if cancelled.is_set():
+                    break
+                loop.call_soon_threadsafe(events.put_nowait, item)
+        except Exception as e:
+            loop.call_soon_threadsafe(events.put_nowait, ("error", {"message": str(e)}))
+        finally:
+            loop.call_soon_threadsafe(events.put_nowait, done)
+
+    _submit_holding_slot(produce)
+
+    async def stream():
+        try:
+            while True:
+                item = await events.get()
+                if item is done:
+                    break
+                yield item
+        finally:
+            cancelled.set()
+
+    return stream()
+
+def invalidate_graph_cache():
+    """Forget cached answers and Neo4j results; None until the assistant is initialized"""
+    if _loaded_assistant() is None:
+        return None
+    return _kg_rag().invalidate_graph_results()
+
+def get_cache_stats():
+    """Answer cache counters, or None until the assistant is initialized"""
+    assistant = _loaded_assistant()
+    if assistant is None:
+        return None
+    return assistant.cache.stats()
+
 
+def flush_history():
+    """Commit chat messages still queued for Neo4j; called on shutdown"""
+    history = sys.modules.get("api.kg_rag.history")
+    if history is not None:
+        history.history_writer.close()
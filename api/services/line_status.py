@@ -0,0 +1,86 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+# A production line is one machine type running one batch
+LINE_KEY = ['Machine Type', 'Batch']
+UTILIZATION_COLUMN = 'Machine Utilization (%)'
+AGE_COLUMN = 'Machine Age (years)'
+
+# Utilization at or above OPERATIONAL is "operational", at or above WARNING
+# is "warning", anything lower is "down".
+DEFAULT_OPERATIONAL_THRESHOLD = float(os.getenv("STATUS_OPERATIONAL_THRESHOLD", "55"))
+DEFAULT_WARNING_THRESHOLD = float(os.getenv("STATUS_WARNING_THRESHOLD", "50"))
+
+
+class LatestStateIndex:
+    """Most recent row of every production line, maintained as rows arrive.
+
+    The frame holds one row per line, indexed by a line number assigned the
+    first time the line is seen, so line ids stay stable as newer rows replace
+    older ones. An update only touches the lines present in the new rows.
+    """
+
+    def __init__(self):
+        self.frame = pd.DataFrame(columns=LINE_KEY + ['Date', UTILIZATION_COLUMN, AGE_COLUMN])
+        self.line_numbers = {}
+
+    def copy(self):
+        """Independent index; update() rebinds the frame but adds to line_numbers"""
+        index = LatestStateIndex.__new__(LatestStateIndex)
+        index.frame = self.frame
+        index.line_numbers = dict(self.line_numbers)
+        return index
+
+    def update(self, df):
+        if df.empty:
+            return
+        new = df[LINE_KEY + ['Date', UTILIZATION_COLUMN, AGE_COLUMN]]
+        # Stable sort keeps file order among rows of the same date, so the
+        # last row written for a line wins ties.
+        new = new.sort_values('Date', kind='stable')
+        new = new[~new.duplicated(LINE_KEY, keep='last')]
+        new.index = pd.Index(
+            [
+                self.line_numbers.setdefault(key, len(self.line_numbers))
+                for key in zip(new[LINE_KEY[0]].tolist(), new[LINE_KEY[1]].tolist())
+            ],
+            dtype="int64",
+        )
+        if self.frame.empty:
+            self.frame = new.sort_index()
+            return
+        combined = pd.concat([self.frame, new]).sort_values('Date', kind='stable')
+        self.frame = combined[~combined.index.duplicated(keep='last')].sort_index()
+
+    def __len__(self):
+        return len(self.frame)
+
+
+def classify(utilization, operational=DEFAULT_OPERATIONAL_THRESHOLD, warning=DEFAULT_WARNING_THRESHOLD):
+    """Vectorized operational/warning/down classification of utilization values"""
+    utilization = np.asarray(utilization, dtype="float64")
+    return np.select(
+        [utilization >= operational, utilization >= warning],
+        ["operational", "warning"],
+        default="down",
+    )
+
+
+def line_status(frame, operational=DEFAULT_OPERATIONAL_THRESHOLD, warning=DEFAULT_WARNING_THRESHOLD):
+    """Build the /status payload for every line in a LatestStateIndex frame"""
+    if frame.empty:
+        return []
+    utilization = frame[UTILIZATION_COLUMN]
+    ids = "line-" + frame.index.astype(str)
+    names = frame[LINE_KEY[0]].astype(str) + " - " + frame[LINE_KEY[1]].astype(str)
+    statuses = classify(utilization.to_numpy(dtype="float64", na_value=np.nan), operational, warning)
+    efficiencies = utilization.astype(str) + "%"
+    maintenance = np.char.mod("%.1f years", frame[AGE_COLUMN].to_numpy(dtype="float64", na_value=np.nan))
+    return [
+        {"id": i, "name": n, "status": s, "efficiency": e, "lastMaintenance": m}
+        for i, n, s, e, m in zip(
+            ids.tolist(), names.tolist(), statuses.tolist(), efficiencies.tolist(), maintenance.tolist()
+        )
+    ]
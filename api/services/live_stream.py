@@ -0,0 +1,123 @@
+import asyncio
+import threading
+from collections import OrderedDict
+
+from api.services import serialization
+from api.services.data_store import data_store
+
+KPI_FIELDS = ["production", "efficiency", "downtime", "profitMargin"]
+
+# Seconds between keep-alive comments on an idle stream
+HEARTBEAT_INTERVAL = 15.0
+
+
+class SnapshotBroadcaster:
+    """Wakes every connected stream when DataStore publishes a snapshot.
+
+    Snapshots are published from loader/tailer threads, so waiters are woken
+    with call_soon_threadsafe on the event loop that is waiting.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._waiters = set()
+        self._deltas = OrderedDict()
+
+    def publish(self, snapshot):
+        with self._lock:
+            waiters = list(self._waiters)
+        for loop, event in waiters:
+            loop.call_soon_threadsafe(event.set)
+
+    async def wait_for_version(self, version, timeout):
+        """Wait until a snapshot newer than ``version`` exists, or the timeout passes"""
+        event = asyncio.Event()
+        waiter = (asyncio.get_running_loop(), event)
+        with self._lock:
+            self._waiters.add(waiter)
+        try:
+            snapshot = data_store.snapshot
+            if snapshot is not None and snapshot.version > version:
+                return snapshot
+            try:
+                await asyncio.wait_for(event.wait(), timeout)
+            except asyncio.TimeoutError:
+                return None
+            return data_store.snapshot
+        finally:
+            with self._lock:
+                self._waiters.discard(waiter)
+
+    def delta(self, previous, current):
+        """Encoded delta event between two snapshots, shared by every stream"""
+        key = (previous.version, current.version)
+        with self._lock:
+            cached = self._deltas.get(key)
+        if cached is not None:
+            return cached
+        encoded = serialization.dumps(compute_delta(previous, current))
+        with self._lock:
+            self._deltas[key] = encoded
+            while len(self._deltas) > 32:
+                self._deltas.popitem(last=False)
+        return encoded
+
+
+def compute_delta(previous, current):
+    """Changed line statuses and new or updated time-series points"""
+    previous_status = {line["id"]: line for line in previous.status}
+    current_ids = set()
+    status = []
+    for line in current.status:
+        current_ids.add(line["id"])
+        if previous_status.get(line["id"]) != line:
+            status.append(line)
+
+    previous_points = {point["name"]: point for point in previous.metrics["timeSeriesData"]}
+    points = [
+        point for point in current.metrics["timeSeriesData"]
+        if previous_points.get(point["name"]) != point
+    ]
+    return {
+        "version": current.version,
+        "fromVersion": previous.version,
+        "kpis": {field: current.metrics[field] for field in KPI_FIELDS},
+        "status": status,
+        "removedStatus": [line_id for line_id in previous_status if line_id not in current_ids],
+        "timeSeriesData": points,
+    }
+
+
+def snapshot_event(snapshot):
+    """Full-state event sent when a client connects"""
+    body = b"".join([
+        b'{"version":', str(snapshot.version).encode(),
+        b',"metrics":', snapshot.encoded["metrics"],
+        b',"status":', snapshot.encoded["status"],
+        b"}",
+    ])
+    return format_event("snapshot", body, snapshot.version)
+
+
+def format_event(event, data, event_id=None):
+    lines = [f"event: {event}\n".encode()]
+    if event_id is not None:
+        lines.append(f"id: {event_id}\n".encode())
+    lines.append(b"data: " + data + b"\n\n")
+    return b"".join(lines)
+
+
+async def factory_event_stream(request, snapshot):
+    """Server-Sent Events: one snapshot, then deltas whenever the data changes"""
+    yield snapshot_event(snapshot)
+    while not await request.is_disconnected():
+        current = await broadcaster.wait_for_version(snapshot.version, HEARTBEAT_INTERVAL)
+        if current is None or current.version <= snapshot.version:
+            yield b": keep-alive\n\n"
+            continue
+        yield format_event("delta", broadcaster.delta(snapshot, current), current.version)
+        snapshot = current
+
+
+broadcaster = SnapshotBroadcaster()
+data_store.add_listener(broadcaster.publish)
@@ -0,0 +1,196 @@
+import copy
+import math
+
+import numpy as np
+import pandas as pd
+
+# Accuracy parameter: rank error is roughly 1.7 / DEFAULT_K of the item count
+DEFAULT_K = 200
+
+_SHRINK = 2.0 / 3.0
+
+_rng = np.random.default_rng()
+
+
+class KLLSketch:
+    """Mergeable streaming quantile sketch (Karnin, Lang & Liberty).
+
+    Items sit in a stack of compactors; an item on level h stands for 2**h
+    input values. When a level outgrows its capacity it is sorted and every
+    other item (random offset) is promoted, halving its size. Memory is
+    O(k log n) and two sketches merge by concatenating their levels, so
+    per-partition sketches combine into one for any union of partitions.
+
+    Levels are replaced rather than modified, so a shallow ``copy()`` is an
+    independent sketch; snapshots rely on that to stay immutable.
+    """
+
+    def __init__(self, k=DEFAULT_K):
+        self.k = k
+        self.count = 0
+        self.levels = [np.empty(0, dtype="float64")]
+
+    def copy(self):
+        sketch = copy.copy(self)
+        sketch.levels = list(self.levels)
+        return sketch
+
+    def update(self, values):
+        """Add a batch of values; NaNs are ignored"""
+        values = np.asarray(values, dtype="float64")
+        values = values[~np.isnan(values)]
+        if not values.size:
+            return self
+        self.count += values.size
+        self.levels[0] = np.concatenate([self.levels[0], values])
+        self._compress()
+        return self
+
+    def merge(self, other):
+        """Fold another sketch (e.g. another day or partition) into this one"""
+        if not other.count:
+            return self
+        self.count += other.count
+        while len(self.levels) < len(other.levels):
+            self.levels.append(np.empty(0, dtype="float64"))
+        for height, items in enumerate(other.levels):
+            if items.size:
+                self.levels[height] = np.concatenate([self.levels[height], items])
+        self._compress()
+        return self
+
+    def _capacity(self, height):
+        depth = len(self.levels) - height - 1
+        return max(2, int(math.ceil(self.k * _SHRINK ** depth)))
+
+    def _size(self):
+        return sum(items.size for items in self.levels)
+
+    def _budget(self):
+        return sum(self._capacity(height) for height in range(len(self.levels)))
+
+    def _compress(self):
+        while self._size() > self._budget():
+            for height, items in enumerate(self.levels):
+                if items.size < self._capacity(height):
+                    continue
+                if height + 1 == len(self.levels):
+                    self.levels.append(np.empty(0, dtype="float64"))
+                items = np.sort(items)
+                # An odd item out stays behind so the promoted weight is exact
+                keep = items[:1] if items.size % 2 else items[:0]
+                pairs = items[keep.size:]
+                promoted = pairs[int(_rng.integers(2))::2]
+                self.levels[height] = keep
+                self.levels[height + 1] = np.concatenate([self.levels[height + 1], promoted])
+                break
+
+    def quantiles(self, fractions):
+        """Approximate values at the given fractions (0..1) of the distribution"""
+        if not self.count:
+            return [float("nan")] * len(fractions)
+        values = np.concatenate(self.levels)
+        weights = np.concatenate([
+            np.full(items.size, 2 ** height, dtype="float64") for height, items in enumerate(self.levels)
+        ])
+        order = np.argsort(values, kind="stable")
+        values = values[order]
+        cumulative = np.cumsum(weights[order])
+        ranks = np.clip(np.asarray(fractions, dtype="float64"), 0.0, 1.0) * cumulative[-1]
+        positions = np.searchsorted(cumulative, ranks, side="left")
+        return values[np.minimum(positions, values.size - 1)].tolist()
+
+
+def merged(sketches, k=DEFAULT_K):
+    """One sketch summarizing every sketch in ``sketches``"""
+    result = KLLSketch(k)
+    for sketch in sketches:
+        result.merge(sketch)
+    return result
+
+
+class DailySketches:
+    """A KLL sketch per metric per day, plus one per metric over all days.
+
+    Updating a day copies its sketch before adding to it and rebinds the
+    dictionaries, so views handed to snapshots never change.
+    """
+
+    def __init__(self, metric_columns, k=DEFAULT_K):
+        self.metric_columns = metric_columns
+        self.k = k
+        self.days = {name: {} for name in metric_columns}
+        self.totals = {name: KLLSketch(k) for name in metric_columns}
+
+    def update(self, df):
+        if df.empty:
+            return
+        dates = df['Date'].dt.normalize()
+        days = dict(self.days)
+        totals = dict(self.totals)
+        for name, column in self.metric_columns.items():
+            if column not in df:
+                continue
+            values = df[column].to_numpy(dtype="float64", na_value=np.nan)
+            per_day = dict(days[name])
+            for day, positions in dates.groupby(dates, sort=False).indices.items():
+                existing = per_day.get(day)
+                sketch = existing.copy() if existing is not None else KLLSketch(self.k)
+                per_day[day] = sketch.update(values[positions])
+            days[name] = per_day
+            totals[name] = totals[name].copy().update(values)
+        self.days = days
+        self.totals = totals
+
+    def view(self):
+        """Immutable view of the current sketches for a snapshot"""
+        return copy.copy(self)
+
+    def percentiles(self, metric, percentiles, start=None, end=None):
+        """{"p<N>": value} for ``metric`` over the days in [start, end]"""
+        if start is None and end is None:
+            sketch = self.totals[metric]
+        else:
+            start = pd.Timestamp(start) if start is not None else None
+            end = pd.Timestamp(end) if end is not None else None
+            sketch = merged(
+                (
+                    sketch for day, sketch in self.days[metric].items()
+                    if (start is None or day >= start) and (end is None or day <= end)
+                ),
+                self.k,
+            )
+        values = sketch.quantiles([p / 100.0 for p in percentiles])
+        return {
+            f"p{p:g}": (None if math.isnan(value) else float(value))
+            for p, value in zip(percentiles, values)
+        }
+
+
+def _benchmark(rows=1_000_000, batches=100):
+    """Accuracy and cost of per-batch sketches against exact percentiles"""
+    import time
+
+    data = _rng.normal(85, 8, rows)
+    fractions = [0.05, 0.5, 0.95]
+    started = time.perf_counter()
+    sketches = [KLLSketch().update(batch) for batch in np.array_split(data, batches)]
+    built = time.perf_counter() - started
+    started = time.perf_counter()
+    estimate = merged(sketches).quantiles(fractions)
+    merge_time = time.perf_counter() - started
+    started = time.perf_counter()
+    exact = np.quantile(data, fractions)
+    exact_time = time.perf_counter() - started
+    retained = sum(s._size() for s in sketches)
+    print(f"{rows} rows in {batches} sketches: build {built * 1e3:.1f} ms, {retained} values retained")
+    print(f"merge + query {merge_time * 1e3:.2f} ms, exact np.quantile {exact_time * 1e3:.2f} ms")
+    sorted_data = np.sort(data)
+    for fraction, approx, true in zip(fractions, estimate, exact):
+        rank = np.searchsorted(sorted_data, approx) / rows
+        print(f"p{fraction * 100:g}: sketch {approx:.3f} exact {true:.3f} rank error {abs(rank - fraction):.4f}")
+
+
+if __name__ == "__main__":
+    #   python -m api.services.sketches
+    _benchmark()
@@ -0,0 +1,146 @@
+import numpy as np
+import pandas as pd
+
+# Dashboard metric name -> CSV column. The first three are charted in
+# timeSeriesData; profit margin is only needed for the window averages.
+SERIES_COLUMNS = {
+    "production": "Production Volume (units)",
+    "efficiency": "Machine Utilization (%)",
+    "downtime": "Machine Downtime (hours)",
+    "profitMargin": "Profit Margin (%)",
+}
+CHART_SERIES = ["production", "efficiency", "downtime"]
+
+# Resolution -> (pandas period frequency, label format)
+RESOLUTIONS = {
+    "day": ("D", "%Y-%m-%d"),
+    "week": ("W-SUN", "%Y-%m-%d"),
+    "month": ("M", "%Y-%m"),
+}
+
+
+def build_daily_frame(df):
+    """Collapse the raw rows into one row of per-metric sums and counts per day.
+
+    Keeping sums and counts (rather than means) lets any date range or coarser
+    resolution be rolled up exactly without going back to the raw rows.
+    """
+    columns = {}
+    days = df['Date'].dt.normalize()
+    # Accumulate in float64 even when the source columns were narrowed to float32
+    grouped = df[list(SERIES_COLUMNS.values())].astype("float64").groupby(days)
+    sums = grouped.sum()
+    counts = grouped.count()
+    for name, column in SERIES_COLUMNS.items():
+        columns[f"{name}_sum"] = sums[column].astype("float64")
+        columns[f"{name}_count"] = counts[column].astype("int64")
+    daily = pd.DataFrame(columns)
+    daily.index.name = "Date"
+    return daily.sort_index()
+
+
+def slice_range(daily, start=None, end=None):
+    """Select the days in [start, end] using the sorted index (no full scan)"""
+    if start is None and end is None:
+        return daily
+    start = pd.Timestamp(start) if start is not None else None
+    end = pd.Timestamp(end) if end is not None else None
+    return daily.loc[start:end]
+
+
+def resample(daily, resolution="day"):
+    """Roll daily sums and counts up to the requested resolution"""
+    if resolution not in RESOLUTIONS:
+        raise ValueError(f"Unsupported resolution '{resolution}', expected one of {list(RESOLUTIONS)}")
+    if resolution == "day" or daily.empty:
+        return daily
+    freq, _ = RESOLUTIONS[resolution]
+    buckets = daily.index.to_period(freq).start_time
+    return daily.groupby(buckets).sum()
+
+
+def window_averages(frame):
+    """Weighted averages of every metric over the whole frame"""
+    averages = {}
+    for name in SERIES_COLUMNS:
+        count = frame[f"{name}_count"].sum()
+        averages[name] = float(frame[f"{name}_sum"].sum() / count) if count else 0.0
+    return averages
+
+
+def lttb_indices(x, y, threshold):
+    """Largest-Triangle-Three-Buckets downsampling.
+
+    Returns the positions of ``threshold`` points that best preserve the
+    visual shape of the (x, y) line; the first and last points are always kept.
+    """
+    n = len(y)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+
+    selected = np.empty(threshold, dtype=np.int64)
+    selected[0] = 0
+    selected[-1] = n - 1
+    bucket_size = (n - 2) / (threshold - 2)
+    a = 0
+    for i in range(threshold - 2):
+        bucket_start = int(np.floor(i * bucket_size)) + 1
+        bucket_end = int(np.floor((i + 1) * bucket_size)) + 1
+        next_start = bucket_end
+        next_end = min(int(np.floor((i + 2) * bucket_size)) + 1, n)
+        if next_start >= next_end:
+            next_start, next_end = n - 1, n
+        avg_x = x[next_start:next_end].mean()
+        avg_y = y[next_start:next_end].mean()
+
+        bucket_x = x[bucket_start:bucket_end]
+        bucket_y = y[bucket_start:bucket_end]
+        areas = np.abs(
+            (x[a] - avg_x) * (bucket_y - y[a]) - (x[a] - bucket_x) * (avg_y - y[a])
+        )
+        a = bucket_start + int(np.argmax(areas))
+        selected[i + 1] = a
+    return selected
+
+
+def to_time_series(frame, resolution="day", points=None):
+    """Convert a (resampled) frame of sums and counts into timeSeriesData rows"""
+    if frame.empty:
+        return []
+    _, label_format = RESOLUTIONS[resolution]
+    means = {
+        name: (frame[f"{name}_sum"] / frame[f"{name}_count"]).to_numpy(dtype="float64")
+        for name in CHART_SERIES
+    }
+    names = frame.index.strftime(label_format).to_numpy()
+
+    if points is not None and points < len(frame):
+        # Downsample on the production series; the other series follow the
+        # same positions so every chart point stays a real bucket.
+        x = frame.index.asi8.astype("float64")
+        keep = lttb_indices(x, means["production"], points)
+        names = names[keep]
+        means = {name: values[keep] for name, values in means.items()}
+
+    return [
+        {"name": name, "production": production, "efficiency": efficiency, "downtime": downtime}
+        for name, production, efficiency, downtime in zip(
+            names.tolist(),
+            means["production"].tolist(),
+            means["efficiency"].tolist(),
+            means["downtime"].tolist(),
+        )
+    ]
+
+
+def query_metrics(daily, start=None, end=None, resolution="day", points=None):
+    """Answer a metrics request for a date window from the daily frame"""
+    window = slice_range(daily, start, end)
+    averages = window_averages(window)
+    return {
+        "production": round(averages["production"], 2),
+        "efficiency": averages["efficiency"],
+        "downtime": averages["downtime"],
+        "profitMargin": averages["profitMargin"],
+        "timeSeriesData": to_time_series(resample(window, resolution), resolution, points),
+    }
@@ -0,0 +1,63 @@
+import argparse
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def import_times(module):
+    """Run ``import module`` in a fresh interpreter under -X importtime.
+
+    Returns the wall time of the import in seconds and a list of
+    (self_us, cumulative_us, depth, name) for every module imported.
+    """
+    code = (
+        "import time; started = time.perf_counter(); "
+        f"import {module}; "
+        "print(time.perf_counter() - started)"
+    )
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+    )
+    if completed.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{completed.stderr[-2000:]}")
+    rows = []
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        depth = (len(name) - len(name.lstrip())) // 2
+        rows.append((int(self_us), int(cumulative_us), depth, name.strip()))
+    return float(completed.stdout.strip().splitlines()[-1]), rows
+
+
+def report(module="api.main", top=20):
+    """Print the import-time breakdown of ``module``"""
+    wall, rows = import_times(module)
+    print(f"import {module}: {wall * 1e3:.0f} ms wall, {len(rows)} modules")
+
+    # Top-level packages, with everything they pulled in
+    packages = {}
+    for self_us, _, _, name in rows:
+        package = name.split(".")[0]
+        packages[package] = packages.get(package, 0) + self_us
+    print("\nSlowest packages (self time of all their modules):")
+    for package, total in sorted(packages.items(), key=lambda item: item[1], reverse=True)[:top]:
+        print(f"  {total / 1e3:8.1f} ms  {package}")
+
+    print("\nSlowest imports (cumulative):")
+    for _, cumulative_us, depth, name in sorted(rows, key=lambda row: row[1], reverse=True)[:top]:
+        print(f"  {cumulative_us / 1e3:8.1f} ms  {'  ' * min(depth, 4)}{name}")
+
+
+if __name__ == "__main__":
+    #   python -m api.startup_profile [--module api.main] [--top 20]
+    parser = argparse.ArgumentParser(description="Import-time breakdown of the API process start-up")
+    parser.add_argument("--module", default="api.main")
+    parser.add_argument("--top", type=int, default=20)
+    args = parser.parse_args()
+    report(args.module, args.top)
@@ -33,6 +33,8 @@ export default function FactoryBot() {
   const [isThinking, setIsThinking] = useState(false)
   const messagesEndRef = useRef<HTMLDivElement>(null)
   const inputRef = useRef<HTMLInputElement>(null)
+  // Conversation id issued by the API on the first answer
+  const sessionIdRef = useRef<string | undefined>(undefined)
 
   useEffect(() => {
     scrollToBottom()
@@ -70,7 +72,7 @@ export default function FactoryBot() {
       await new Promise((resolve) => setTimeout(resolve, 500))
 
       // Send message to API
-      const response = await FactoryApi.sendBotMessage(input)
+      const response = await FactoryApi.sendBotMessage(input, sessionIdRef.current)
 
       // Keep thinking animation for a minimum time
       await new Promise((resolve) => setTimeout(resolve, 800))
@@ -78,6 +80,7 @@ export default function FactoryBot() {
       setIsThinking(false)
 
       if (response.success && response.data) {
+        sessionIdRef.current = response.data.sessionId
         const botResponse: Message = {
           id: (Date.now() + 1).toString(),
           content: response.data.message,
@@ -6,7 +6,14 @@ import { Tabs, TabsContent, TabsList, TabsTrigger } from "@/components/ui/tabs"
 import { ArrowUp, Factory, LineChart, Percent, TrendingUp, RefreshCw } from "lucide-react"
 import { FactoryMetricsChart } from "@/components/charts/factory-metrics-chart"
 import { FactoryStatusTable } from "@/components/tables/factory-status-table"
-import { FactoryApi, type FactoryMetrics, type FactoryStatus, type TimeSeriesDataPoint } from "@/lib/api-service"
+import {
+  FactoryApi,
+  applyMetricsDelta,
+  applyStatusDelta,
+  type FactoryMetrics,
+  type FactoryStatus,
+  type TimeSeriesDataPoint,
+} from "@/lib/api-service"
 import { Alert, AlertDescription, AlertTitle } from "@/components/ui/alert"
 import { Skeleton } from "@/components/ui/skeleton"
 import { Button } from "@/components/ui/button"
@@ -16,6 +23,9 @@ import { motion } from "framer-motion"
 
 type TimeFilter = "monthly" | "yearly"
 
+// Polling interval used only while the live stream is disconnected
+const FALLBACK_POLL_MS = 30000
+
 // Monthly data for development
 const monthlyData: TimeSeriesDataPoint[] = [
   { name: "January", production: 4200, efficiency: 82, downtime: 12 },
@@ -63,9 +73,12 @@ export default function FactoryDashboard() {
   const [animatedDowntime, setAnimatedDowntime] = useState(0)
   const [animatedProfitMargin, setAnimatedProfitMargin] = useState(0)
   const prevMetricsRef = useRef<FactoryMetrics | null>(null)
+  // Latest streamed version; deltas for any other base version are ignored
+  const versionRef = useRef<number | null>(null)
+  const pollTimerRef = useRef<ReturnType<typeof setInterval> | null>(null)
 
-  const fetchData = useCallback(async () => {
-    setLoading(true)
+  const fetchData = useCallback(async (showLoading = true) => {
+    if (showLoading) setLoading(true)
     setError(null)
     try {
       // Fetch metrics
@@ -93,7 +106,44 @@ export default function FactoryDashboard() {
   }, [])
 
   useEffect(() => {
-    fetchData()
+    const stopPolling = () => {
+      if (pollTimerRef.current) {
+        clearInterval(pollTimerRef.current)
+        pollTimerRef.current = null
+      }
+    }
+
+    const unsubscribe = FactoryApi.subscribeFactoryStream(
+      (snapshot) => {
+        // Every (re)connection starts with a full snapshot
+        stopPolling()
+        versionRef.current = snapshot.version
+        setMetrics(snapshot.metrics)
+        setStatus(snapshot.status)
+        setError(null)
+        setLoading(false)
+        setRefreshing(false)
+      },
+      (delta) => {
+        if (versionRef.current !== delta.fromVersion) return
+        versionRef.current = delta.version
+        setMetrics((current) => current && applyMetricsDelta(current, delta))
+        setStatus((current) => current && applyStatusDelta(current, delta))
+      },
+      () => {
+        // Fall back to polling until the stream reconnects
+        versionRef.current = null
+        if (!pollTimerRef.current) {
+          fetchData(false)
+          pollTimerRef.current = setInterval(() => fetchData(false), FALLBACK_POLL_MS)
+        }
+      },
+    )
+
+    return () => {
+      unsubscribe()
+      stopPolling()
+    }
   }, [fetchData])
 
   const displayMetrics = metrics || fallbackMetrics
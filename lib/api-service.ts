@@ -27,6 +27,26 @@ export interface FactoryStatus {
 // Add interface for bot message response
 export interface BotResponse {
   message: string
+  sessionId: string // pass back to continue the same conversation
+}
+
+// Events pushed by /api/factory/bot/stream
+export type BotStreamEvent = "cypher" | "token" | "done" | "error"
+
+// Events pushed by /api/factory/stream
+export interface FactorySnapshotEvent {
+  version: number
+  metrics: FactoryMetrics
+  status: FactoryStatus[]
+}
+
+export interface FactoryDeltaEvent {
+  version: number
+  fromVersion: number
+  kpis: Pick<FactoryMetrics, "production" | "efficiency" | "downtime" | "profitMargin">
+  status: FactoryStatus[] // lines whose status changed or that are new
+  removedStatus: string[] // ids of lines that disappeared
+  timeSeriesData: TimeSeriesDataPoint[] // new or updated points
 }
 
 interface ApiResponse<T> {
@@ -35,6 +55,22 @@ interface ApiResponse<T> {
   error?: string
 }
 
+// Apply a stream delta to the metrics it was computed from
+export function applyMetricsDelta(metrics: FactoryMetrics, delta: FactoryDeltaEvent): FactoryMetrics {
+  const points = new Map<string, TimeSeriesDataPoint>(metrics.timeSeriesData.map((point) => [point.name, point]))
+  for (const point of delta.timeSeriesData) points.set(point.name, point)
+  return { ...metrics, ...delta.kpis, timeSeriesData: Array.from(points.values()) }
+}
+
+// Apply a stream delta to the line statuses it was computed from
+export function applyStatusDelta(status: FactoryStatus[], delta: FactoryDeltaEvent): FactoryStatus[] {
+  const removed = new Set(delta.removedStatus)
+  const changed = new Map<string, FactoryStatus>(delta.status.map((line) => [line.id, line]))
+  const lines = status.filter((line) => !removed.has(line.id)).map((line) => changed.get(line.id) ?? line)
+  const known = new Set(lines.map((line) => line.id))
+  return lines.concat(delta.status.filter((line) => !known.has(line.id)))
+}
+
 export const FactoryApi = {
   getFactoryMetrics: async (): Promise<ApiResponse<FactoryMetrics>> => {
     try {
@@ -64,14 +100,14 @@ export const FactoryApi = {
     }
   },
 
-  sendBotMessage: async (message: string): Promise<ApiResponse<BotResponse>> => {
+  sendBotMessage: async (message: string, sessionId?: string): Promise<ApiResponse<BotResponse>> => {
     try {
       const response = await fetch("/api/factory/bot", {
         method: "POST",
         headers: {
           "Content-Type": "application/json",
         },
-        body: JSON.stringify({ message }),
+        body: JSON.stringify({ message, sessionId }),
       })
 
       if (!response.ok) {
@@ -85,5 +121,81 @@ export const FactoryApi = {
       return { success: false, error: "Failed to communicate with the factory bot" }
     }
   },
-}
 
+  // Stream the bot answer as it is generated. onEvent receives "cypher"
+  // ({ status, query }), "token" ({ token }), "done" ({ message, sessionId }) and
+  // "error" ({ message }) events; resolves once the stream has ended.
+  streamBotMessage: async (
+    message: string,
+    onEvent: (event: BotStreamEvent, data: any) => void,
+    sessionId?: string,
+  ): Promise<ApiResponse<BotResponse>> => {
+    try {
+      const response = await fetch("/api/factory/bot/stream", {
+        method: "POST",
+        headers: {
+          "Content-Type": "application/json",
+        },
+        body: JSON.stringify({ message, sessionId }),
+      })
+
+      if (!response.ok || !response.body) {
+        throw new Error(`HTTP error! status: ${response.status}`)
+      }
+
+      const reader = response.body.getReader()
+      const decoder = new TextDecoder()
+      let buffer = ""
+      let result: BotResponse | undefined
+      while (true) {
+        const { done, value } = await reader.read()
+        if (done) break
+        buffer += decoder.decode(value, { stream: true })
+        // SSE frames are separated by a blank line
+        let boundary: number
+        while ((boundary = buffer.indexOf("\n\n")) >= 0) {
+          const frame = buffer.slice(0, boundary)
+          buffer = buffer.slice(boundary + 2)
+          let event = "message"
+          const dataLines: string[] = []
+          for (const line of frame.split("\n")) {
+            if (line.startsWith("event:")) event = line.slice(6).trim()
+            else if (line.startsWith("data:")) dataLines.push(line.slice(5).trim())
+          }
+          if (!dataLines.length) continue
+          const data = JSON.parse(dataLines.join("\n"))
+          onEvent(event as BotStreamEvent, data)
+          if (event === "done") result = data
+          if (event === "error") throw new Error(data.message)
+        }
+      }
+      return result ? { success: true, data: result } : { success: false, error: "Bot stream ended early" }
+    } catch (error) {
+      console.error("Error streaming message from bot:", error)
+      return { success: false, error: "Failed to communicate with the factory bot" }
+    }
+  },
+
+  // Subscribe to live metrics/status updates instead of polling. Returns a
+  // function that closes the connection; EventSource reconnects on its own and
+  // every (re)connection starts with a full snapshot. onError is called while
+  // the connection is down.
+  subscribeFactoryStream: (
+    onSnapshot: (snapshot: FactorySnapshotEvent) => void,
+    onDelta: (delta: FactoryDeltaEvent) => void,
+    onError?: () => void,
+  ): (() => void) => {
+    const source = new EventSource("/api/factory/stream")
+    source.addEventListener("snapshot", (event) => {
+      onSnapshot(JSON.parse((event as MessageEvent).data))
+    })
+    source.addEventListener("delta", (event) => {
+      onDelta(JSON.parse((event as MessageEvent).data))
+    })
+    source.onerror = (error) => {
+      console.error("Factory stream error:", error)
+      onError?.()
+    }
+    return () => source.close()
+  },
+}